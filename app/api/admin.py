@@ -1,23 +1,47 @@
 """Admin API endpoints for UI"""
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select, func, or_, and_, case, bindparam, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime
 import uuid
-from cryptography.fernet import Fernet
 import os
 
+try:
+    # Rust fernet bindings; tokens and keys are compatible with cryptography's Fernet
+    from rfernet import Fernet
+    _generate_key = Fernet.generate_new_key
+except ImportError:
+    from cryptography.fernet import Fernet
+    
+    def _generate_key() -> str:
+        """Generate a Fernet key as a str, matching rfernet"""
+        return Fernet.generate_key().decode()
+
+from app.config import get_settings
 from app.database import get_db, AgentCredentials, AgentActivity, TestEmail
-from app.auth import get_current_user, require_role, User
+from app.services.activity_queue import activity_queue
+from app.auth import get_current_user, require_role, CurrentUser
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
+settings = get_settings()
+
 # Encryption key for credentials (store in env in production)
-ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", Fernet.generate_key())
+ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY") or _generate_key()
 cipher_suite = Fernet(ENCRYPTION_KEY)
 
 
+def encrypt_value(value: str) -> str:
+    """Encrypt a credential value to a Fernet token string"""
+    token = cipher_suite.encrypt(value.encode())
+    # rfernet returns str tokens, cryptography returns bytes
+    return token if isinstance(token, str) else token.decode()
+
+
 class CredentialUpdate(BaseModel):
     service_name: str
     credential_key: str
@@ -54,104 +78,133 @@ class AgentStats(BaseModel):
     average_speed_to_lead: float
 
 
+# Agent stats query, built once at import so handlers only bind :today
+_today = bindparam("today", type_=DateTime)
+_is_lead = AgentActivity.activity_type == "lead_processed"
+_is_call_today = and_(AgentActivity.activity_type == "call_made", AgentActivity.timestamp >= _today)
+_is_sms_today = and_(AgentActivity.activity_type == "sms_sent", AgentActivity.timestamp >= _today)
+# This would come from Airtable in real implementation
+_is_qualified = AgentActivity.status == "qualified"
+
+STATS_STMT = select(
+    func.count().filter(_is_lead),
+    func.count().filter(_is_call_today),
+    func.count().filter(_is_sms_today),
+    func.count().filter(_is_qualified),
+).where(or_(_is_lead, _is_call_today, _is_sms_today, _is_qualified))
+
+
 @router.get("/stats", response_model=AgentStats)
 async def get_agent_stats(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get agent performance statistics"""
     from datetime import date
+    from app.services import async_redis_client
     
     today = date.today()
     
-    # Count activities
-    total_leads = db.query(AgentActivity).filter(
-        AgentActivity.activity_type == "lead_processed"
-    ).count()
-    
-    calls_today = db.query(AgentActivity).filter(
-        AgentActivity.activity_type == "call_made",
-        AgentActivity.timestamp >= today
-    ).count()
+    cache_key = f"stats:admin:{today.isoformat()}"
+    cached = await async_redis_client.get_cached(cache_key)
+    if cached:
+        return AgentStats.model_validate_json(cached)
     
-    sms_today = db.query(AgentActivity).filter(
-        AgentActivity.activity_type == "sms_sent",
-        AgentActivity.timestamp >= today
-    ).count()
+    # Count all activities in a single round-trip
+    total_leads, calls_today, sms_today, qualified = db.execute(
+        STATS_STMT, {"today": today}
+    ).one()
     
-    # This would come from Airtable in real implementation
-    qualified = db.query(AgentActivity).filter(
-        AgentActivity.status == "qualified"
-    ).count()
-    
-    return AgentStats(
+    stats = AgentStats(
         total_leads_processed=total_leads,
         calls_made_today=calls_today,
         sms_sent_today=sms_today,
         qualified_leads=qualified,
         average_speed_to_lead=4.5  # Placeholder
     )
+    
+    await async_redis_client.set_cached(cache_key, stats.model_dump_json(), settings.stats_cache_seconds)
+    
+    return stats
 
 
 @router.get("/credentials", response_model=List[CredentialResponse])
 async def list_credentials(
-    current_user: User = Depends(require_role(["admin", "cmo_agent"])),
+    current_user: CurrentUser = Depends(require_role(["admin", "cmo_agent"])),
     db: Session = Depends(get_db)
 ):
     """List all stored credentials (masked)"""
-    credentials = db.query(AgentCredentials).all()
+    # Only the last 4 characters of the ciphertext are needed for masking
+    value_length = func.length(AgentCredentials.encrypted_value)
+    value_tail = func.substr(
+        AgentCredentials.encrypted_value,
+        case((value_length > 4, value_length - 3), else_=1)
+    )
+    
+    rows = db.execute(
+        select(
+            AgentCredentials.id,
+            AgentCredentials.service_name,
+            AgentCredentials.credential_key,
+            AgentCredentials.updated_at,
+            value_tail.label("tail")
+        )
+    ).all()
     
     return [
         CredentialResponse(
-            id=cred.id,
-            service_name=cred.service_name,
-            credential_key=cred.credential_key,
-            masked_value="*" * 8 + cred.encrypted_value[-4:],
-            updated_at=cred.updated_at
+            id=row.id,
+            service_name=row.service_name,
+            credential_key=row.credential_key,
+            masked_value="*" * 8 + row.tail,
+            updated_at=row.updated_at
         )
-        for cred in credentials
+        for row in rows
     ]
 
 
 @router.post("/credentials")
 async def update_credential(
     credential: CredentialUpdate,
-    current_user: User = Depends(require_role(["admin"])),
+    current_user: CurrentUser = Depends(require_role(["admin"])),
     db: Session = Depends(get_db)
 ):
     """Update or create a credential"""
     # Encrypt value
-    encrypted_value = cipher_suite.encrypt(credential.value.encode()).decode()
+    encrypted_value = encrypt_value(credential.value)
     
-    # Check if exists
-    existing = db.query(AgentCredentials).filter(
-        AgentCredentials.service_name == credential.service_name,
-        AgentCredentials.credential_key == credential.credential_key
-    ).first()
+    # Insert or update in one atomic statement keyed on (service_name, credential_key)
+    new_id = str(uuid.uuid4())
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(AgentCredentials).values(
+        id=new_id,
+        service_name=credential.service_name,
+        credential_key=credential.credential_key,
+        encrypted_value=encrypted_value,
+        updated_at=datetime.utcnow(),
+        updated_by=current_user.username
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AgentCredentials.service_name, AgentCredentials.credential_key],
+        set_={
+            "encrypted_value": stmt.excluded.encrypted_value,
+            "updated_at": stmt.excluded.updated_at,
+            "updated_by": stmt.excluded.updated_by
+        }
+    ).returning(AgentCredentials.id)
     
-    if existing:
-        existing.encrypted_value = encrypted_value
-        existing.updated_at = datetime.utcnow()
-        existing.updated_by = current_user.username
-        db.commit()
-        return {"message": "Credential updated", "id": existing.id}
-    else:
-        new_cred = AgentCredentials(
-            id=str(uuid.uuid4()),
-            service_name=credential.service_name,
-            credential_key=credential.credential_key,
-            encrypted_value=encrypted_value,
-            updated_by=current_user.username
-        )
-        db.add(new_cred)
-        db.commit()
-        return {"message": "Credential created", "id": new_cred.id}
+    credential_id = db.execute(stmt).scalar_one()
+    db.commit()
+    
+    if credential_id == new_id:
+        return {"message": "Credential created", "id": credential_id}
+    return {"message": "Credential updated", "id": credential_id}
 
 
 @router.delete("/credentials/{credential_id}")
 async def delete_credential(
     credential_id: str,
-    current_user: User = Depends(require_role(["admin"])),
+    current_user: CurrentUser = Depends(require_role(["admin"])),
     db: Session = Depends(get_db)
 ):
     """Delete a credential"""
@@ -171,30 +224,37 @@ async def delete_credential(
 @router.get("/activity", response_model=List[ActivityResponse])
 async def get_activity_log(
     limit: int = 50,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get recent agent activity"""
-    activities = db.query(AgentActivity).order_by(
-        AgentActivity.timestamp.desc()
-    ).limit(limit).all()
+    rows = db.execute(
+        select(
+            AgentActivity.id,
+            AgentActivity.activity_type,
+            AgentActivity.lead_phone,
+            AgentActivity.lead_name,
+            AgentActivity.status,
+            AgentActivity.details,
+            AgentActivity.timestamp
+        ).order_by(AgentActivity.timestamp.desc()).limit(limit)
+    ).all()
     
-    return activities
+    return [ActivityResponse(**row._mapping) for row in rows]
 
 
 @router.post("/test-email")
 async def submit_test_email(
     test_data: TestEmailSubmit,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Submit a test email for processing"""
-    from app.services.gmail_service import GmailService
+    from app.services.gmail_service import parse_lead_data
     from app.tasks import process_lead
     
-    # Parse email
-    gmail_service = GmailService()
-    lead_data = gmail_service._parse_lead_data(test_data.email_content)
+    # Parse email (no Gmail connection or OAuth setup needed for this)
+    lead_data = parse_lead_data(test_data.email_content)
     
     if not lead_data:
         raise HTTPException(
@@ -207,7 +267,7 @@ async def submit_test_email(
         id=str(uuid.uuid4()),
         submitted_by=current_user.username,
         email_content=test_data.email_content,
-        parsed_data=str(lead_data),
+        parsed_data=lead_data,
         processing_status="queued"
     )
     
@@ -223,16 +283,13 @@ async def submit_test_email(
     result = process_lead.delay(lead_dict)
     
     # Log activity
-    activity = AgentActivity(
-        id=str(uuid.uuid4()),
+    await activity_queue.log(
         activity_type="test_email_submitted",
+        status="queued",
         lead_phone=lead_data.get("phone"),
         lead_name=lead_data.get("fname"),
-        status="queued",
         details=f"Test submitted by {current_user.username}"
     )
-    db.add(activity)
-    db.commit()
     
     return {
         "message": "Test email queued for processing",
@@ -245,9 +302,9 @@ async def submit_test_email(
 @router.get("/health")
 async def agent_health():
     """Check agent health status"""
-    from app.services import redis_client
+    from app.services import async_redis_client
     
-    redis_ok = redis_client.health_check()
+    redis_ok = await async_redis_client.cached_health_check()
     
     return {
         "status": "healthy" if redis_ok else "degraded",
@@ -256,5 +313,5 @@ async def agent_health():
             "fastapi": "running",
             "celery": "unknown"  # Would need to check Celery
         },
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow()
     }
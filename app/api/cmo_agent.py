@@ -1,12 +1,14 @@
 """API endpoints for CMO Agent to manage this sub-agent"""
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from sqlalchemy import select, func, bindparam, DateTime
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-import uuid
+import orjson
 
 from app.database import get_db, AgentActivity
+from app.services.activity_queue import activity_queue
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/cmo", tags=["cmo-agent"])
@@ -17,6 +19,47 @@ settings = get_settings()
 CMO_API_KEY = settings.cmo_api_key if hasattr(settings, 'cmo_api_key') else "cmo-agent-key-change-me"
 
 
+# Static capability manifest served to the CMO agent
+AGENT_CAPABILITIES = {
+    "agent_id": "lead-qualification-agent-001",
+    "agent_name": "Mesh Cowork Lead Qualifier",
+    "agent_type": "lead_qualification",
+    "role": "account_executive",
+    "department": "cmo",
+    "version": "1.0.0",
+    "capabilities": [
+        "email_monitoring",
+        "outbound_calling",
+        "speech_recognition",
+        "lead_qualification",
+        "sms_followup",
+        "crm_integration"
+    ],
+    "integrations": [
+        "gmail",
+        "twilio",
+        "airtable",
+        "calendly"
+    ],
+    "commands": [
+        "start",
+        "stop",
+        "pause",
+        "resume",
+        "get_status",
+        "get_metrics"
+    ],
+    "metrics_available": [
+        "leads_processed",
+        "calls_made",
+        "sms_sent",
+        "qualification_rate",
+        "speed_to_lead"
+    ]
+}
+AGENT_CAPABILITIES_JSON = orjson.dumps(AGENT_CAPABILITIES)
+
+
 def verify_cmo_agent(x_api_key: str = Header(...)):
     """Verify CMO agent API key"""
     if x_api_key != CMO_API_KEY:
@@ -24,6 +67,42 @@ def verify_cmo_agent(x_api_key: str = Header(...)):
     return True
 
 
+# Activity counts query, built once at import so handlers only bind :since
+ACTIVITY_COUNTS_STMT = (
+    select(
+        AgentActivity.activity_type,
+        AgentActivity.status,
+        func.count(),
+        func.max(AgentActivity.timestamp)
+    )
+    .where(AgentActivity.timestamp >= bindparam("since", type_=DateTime))
+    .group_by(AgentActivity.activity_type, AgentActivity.status)
+)
+
+
+def _activity_counts(
+    db: Session,
+    since: datetime
+) -> Tuple[Dict[Tuple[str, str], int], Optional[datetime]]:
+    """
+    Count activities since a point in time, grouped by (activity_type, status)
+    
+    Returns:
+        (counts, timestamp of the latest activity in the period)
+    """
+    rows = db.execute(ACTIVITY_COUNTS_STMT, {"since": since}).all()
+    
+    counts = {(activity_type, status): count for activity_type, status, count, _ in rows}
+    last_activity = max((last for *_, last in rows), default=None)
+    
+    return counts, last_activity
+
+
+def _count_type(counts: Dict[Tuple[str, str], int], activity_type: str) -> int:
+    """Total count for an activity type across all statuses"""
+    return sum(n for (t, _), n in counts.items() if t == activity_type)
+
+
 class AgentCommand(BaseModel):
     """Command from CMO agent"""
     command: str  # start, stop, pause, resume, get_status
@@ -60,25 +139,26 @@ async def get_agent_status(
     db: Session = Depends(get_db)
 ):
     """Get current agent status for CMO dashboard"""
-    from app.services import redis_client
-    
-    # Get recent activity
-    last_activity = db.query(AgentActivity).order_by(
-        AgentActivity.timestamp.desc()
-    ).first()
+    from app.services import async_redis_client
     
     # Calculate metrics
     today = datetime.utcnow().date()
-    today_activities = db.query(AgentActivity).filter(
-        AgentActivity.timestamp >= today
-    ).all()
+    counts, last_activity = _activity_counts(db, today)
+    
+    # Nothing happened today, so look further back for the latest activity
+    if last_activity is None:
+        last_activity = db.execute(
+            select(AgentActivity.timestamp)
+            .order_by(AgentActivity.timestamp.desc())
+            .limit(1)
+        ).scalar()
     
-    calls_today = sum(1 for a in today_activities if a.activity_type == "call_made")
-    sms_today = sum(1 for a in today_activities if a.activity_type == "sms_sent")
-    leads_today = sum(1 for a in today_activities if a.activity_type == "lead_processed")
+    calls_today = _count_type(counts, "call_made")
+    sms_today = _count_type(counts, "sms_sent")
+    leads_today = _count_type(counts, "lead_processed")
     
     # Check service health
-    redis_ok = redis_client.health_check()
+    redis_ok = await async_redis_client.cached_health_check()
     status = "active" if redis_ok else "error"
     
     return AgentStatusResponse(
@@ -94,7 +174,7 @@ async def get_agent_status(
             "leads_today": leads_today,
             "redis_connected": redis_ok
         },
-        last_activity=last_activity.timestamp if last_activity else None,
+        last_activity=last_activity,
         uptime_hours=24.0  # Placeholder
     )
 
@@ -108,14 +188,11 @@ async def send_command(
     """Send command to agent from CMO"""
     
     # Log command
-    activity = AgentActivity(
-        id=str(uuid.uuid4()),
+    await activity_queue.log(
         activity_type="cmo_command",
         status="received",
-        details=f"Command: {command.command}, Params: {command.parameters}"
+        details=f"Command: {command.command}, Params: {orjson.dumps(command.parameters).decode()}"
     )
-    db.add(activity)
-    db.commit()
     
     # Handle commands
     if command.command == "get_status":
@@ -153,6 +230,7 @@ async def get_lead_report(
     db: Session = Depends(get_db)
 ):
     """Get lead processing report for CMO"""
+    from app.services import async_redis_client
     
     # Calculate date range
     now = datetime.utcnow()
@@ -165,19 +243,22 @@ async def get_lead_report(
     else:
         raise HTTPException(status_code=400, detail="Invalid period")
     
-    # Query activities
-    activities = db.query(AgentActivity).filter(
-        AgentActivity.timestamp >= start_date
-    ).all()
+    cache_key = f"stats:report:{period}:{now.date().isoformat()}"
+    cached = await async_redis_client.get_cached(cache_key)
+    if cached:
+        return LeadReport.model_validate_json(cached)
     
-    total_leads = sum(1 for a in activities if a.activity_type == "lead_processed")
-    calls_made = sum(1 for a in activities if a.activity_type == "call_made")
-    sms_sent = sum(1 for a in activities if a.activity_type == "sms_sent")
-    qualified = sum(1 for a in activities if a.status == "qualified")
+    # Query activity counts
+    counts, _ = _activity_counts(db, start_date)
+    
+    total_leads = _count_type(counts, "lead_processed")
+    calls_made = _count_type(counts, "call_made")
+    sms_sent = _count_type(counts, "sms_sent")
+    qualified = sum(n for (_, s), n in counts.items() if s == "qualified")
     
     conversion_rate = (qualified / total_leads * 100) if total_leads > 0 else 0
     
-    return LeadReport(
+    report = LeadReport(
         period=period,
         total_leads=total_leads,
         qualified_leads=qualified,
@@ -186,17 +267,14 @@ async def get_lead_report(
         average_speed_to_lead=4.5,  # Would calculate from actual data
         conversion_rate=conversion_rate
     )
+    
+    await async_redis_client.set_cached(cache_key, report.model_dump_json(), settings.stats_cache_seconds)
+    
+    return report
 
 
-@router.post("/trigger-lead")
-async def trigger_lead_processing(
-    lead_data: dict,
-    _: bool = Depends(verify_cmo_agent),
-    db: Session = Depends(get_db)
-):
-    """Allow CMO agent to trigger lead processing directly"""
-    from app.tasks import process_lead
-    
+def _prepare_lead(lead_data: dict) -> None:
+    """Validate a CMO-supplied lead and stamp its received time"""
     # Validate required fields
     required = ["fname", "email", "phone"]
     if not all(k in lead_data for k in required):
@@ -208,21 +286,34 @@ async def trigger_lead_processing(
     # Add timestamp if not present
     if "email_received_at" not in lead_data:
         lead_data["email_received_at"] = datetime.utcnow().isoformat()
+
+
+async def _log_triggered_lead(lead_data: dict) -> None:
+    """Log activity for a CMO-triggered lead"""
+    await activity_queue.log(
+        activity_type="cmo_triggered_lead",
+        status="queued",
+        lead_phone=lead_data.get("phone"),
+        lead_name=lead_data.get("fname"),
+        details="Triggered by CMO agent"
+    )
+
+
+@router.post("/trigger-lead")
+async def trigger_lead_processing(
+    lead_data: dict,
+    _: bool = Depends(verify_cmo_agent)
+):
+    """Allow CMO agent to trigger lead processing directly"""
+    from app.tasks import process_lead
+    
+    _prepare_lead(lead_data)
     
     # Queue for processing
     result = process_lead.delay(lead_data)
     
     # Log activity
-    activity = AgentActivity(
-        id=str(uuid.uuid4()),
-        activity_type="cmo_triggered_lead",
-        lead_phone=lead_data.get("phone"),
-        lead_name=lead_data.get("fname"),
-        status="queued",
-        details=f"Triggered by CMO agent"
-    )
-    db.add(activity)
-    db.commit()
+    await _log_triggered_lead(lead_data)
     
     return {
         "status": "success",
@@ -235,43 +326,37 @@ async def trigger_lead_processing(
     }
 
 
+@router.post("/trigger-leads")
+async def trigger_leads_bulk(
+    leads: List[dict],
+    _: bool = Depends(verify_cmo_agent)
+):
+    """Allow CMO agent to trigger processing for many leads at once"""
+    from celery import group
+    from app.tasks import process_lead
+    
+    if not leads:
+        raise HTTPException(status_code=400, detail="No leads provided")
+    
+    for lead_data in leads:
+        _prepare_lead(lead_data)
+    
+    # Queue all leads in one dispatch over a single producer connection
+    result = group(process_lead.s(lead_data) for lead_data in leads).apply_async()
+    
+    # Log activity
+    for lead_data in leads:
+        await _log_triggered_lead(lead_data)
+    
+    return {
+        "status": "success",
+        "message": f"{len(leads)} leads queued for processing",
+        "group_id": result.id,
+        "task_ids": [r.id for r in result.results]
+    }
+
+
 @router.get("/capabilities")
 async def get_agent_capabilities(_: bool = Depends(verify_cmo_agent)):
     """Return agent capabilities for CMO discovery"""
-    return {
-        "agent_id": "lead-qualification-agent-001",
-        "agent_name": "Mesh Cowork Lead Qualifier",
-        "agent_type": "lead_qualification",
-        "role": "account_executive",
-        "department": "cmo",
-        "version": "1.0.0",
-        "capabilities": [
-            "email_monitoring",
-            "outbound_calling",
-            "speech_recognition",
-            "lead_qualification",
-            "sms_followup",
-            "crm_integration"
-        ],
-        "integrations": [
-            "gmail",
-            "twilio",
-            "airtable",
-            "calendly"
-        ],
-        "commands": [
-            "start",
-            "stop",
-            "pause",
-            "resume",
-            "get_status",
-            "get_metrics"
-        ],
-        "metrics_available": [
-            "leads_processed",
-            "calls_made",
-            "sms_sent",
-            "qualification_rate",
-            "speed_to_lead"
-        ]
-    }
+    return Response(content=AGENT_CAPABILITIES_JSON, media_type="application/json")
@@ -1,12 +1,14 @@
 """Authentication and authorization"""
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+from typing import Optional, Dict, Tuple
+import jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+import time
 import uuid
 
 from app.database import get_db, User
@@ -18,8 +20,25 @@ settings = get_settings()
 SECRET_KEY = settings.secret_key if hasattr(settings, 'secret_key') else "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+ACCESS_TOKEN_EXPIRE_DELTA = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+
+# Authenticated users are looked up once per TTL instead of on every request.
+# The cache is per process, so a role or is_active change made directly in the
+# database can take up to USER_CACHE_TTL_SECONDS to apply.
+USER_CACHE_TTL_SECONDS = 30
+USER_CACHE_MAX_SIZE = 1024
+
+# Minimum gap between last_login writes for the same user
+LAST_LOGIN_UPDATE_SECONDS = 60
+
+# Argon2 for new hashes; existing bcrypt hashes still verify and are upgraded on login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    argon2__rounds=2,
+    argon2__memory_cost=19456,
+    deprecated="auto"
+)
 security = HTTPBearer()
 
 
@@ -33,6 +52,17 @@ class TokenData(BaseModel):
     role: Optional[str] = None
 
 
+@dataclass(frozen=True)
+class CurrentUser:
+    """Snapshot of an authenticated user, detached from any DB session"""
+    id: str
+    username: str
+    email: str
+    full_name: Optional[str]
+    role: str
+    is_active: bool
+
+
 class UserCreate(BaseModel):
     username: str
     email: str
@@ -66,10 +96,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     """Create JWT access token"""
     to_encode = data.copy()
     
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.utcnow() + (expires_delta or ACCESS_TOKEN_EXPIRE_DELTA)
     
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -84,20 +111,62 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
     if not user:
         return None
     
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = pwd_context.verify_and_update(password, user.hashed_password)
+    
+    if not verified:
         return None
     
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Re-hash legacy bcrypt passwords with the current scheme
+    if new_hash:
+        user.hashed_password = new_hash
+    
+    # Update last login (throttled to avoid a write on every login burst)
+    now = datetime.utcnow()
+    if not user.last_login or now - user.last_login >= timedelta(seconds=LAST_LOGIN_UPDATE_SECONDS):
+        user.last_login = now
+    
+    if db.is_modified(user):
+        db.commit()
     
     return user
 
 
+_user_cache: Dict[str, Tuple[float, CurrentUser]] = {}
+
+
+def get_user_snapshot(db: Session, username: str) -> Optional[CurrentUser]:
+    """Look up a user by username, reusing recent lookups"""
+    now = time.monotonic()
+    cached = _user_cache.get(username)
+    if cached and now - cached[0] < USER_CACHE_TTL_SECONDS:
+        return cached[1]
+    
+    user = db.query(User).filter(User.username == username).first()
+    
+    if user is None:
+        _user_cache.pop(username, None)
+        return None
+    
+    snapshot = CurrentUser(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        full_name=user.full_name,
+        role=user.role,
+        is_active=user.is_active
+    )
+    
+    if len(_user_cache) >= USER_CACHE_MAX_SIZE:
+        _user_cache.clear()
+    _user_cache[username] = (now, snapshot)
+    
+    return snapshot
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
-) -> User:
+) -> CurrentUser:
     """Get current authenticated user from JWT token"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -115,10 +184,10 @@ async def get_current_user(
         
         token_data = TokenData(username=username, role=payload.get("role"))
     
-    except JWTError:
+    except jwt.PyJWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = get_user_snapshot(db, token_data.username)
     
     if user is None:
         raise credentials_exception
@@ -163,7 +232,7 @@ def create_user(db: Session, user_data: UserCreate) -> User:
 
 def require_role(allowed_roles: list):
     """Decorator to require specific roles"""
-    async def role_checker(current_user: User = Depends(get_current_user)):
+    async def role_checker(current_user: CurrentUser = Depends(get_current_user)):
         if current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
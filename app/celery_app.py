@@ -12,13 +12,23 @@ celery_app = Celery(
 )
 
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
+    # Task payloads are msgpack, which is smaller and quicker to pack than JSON;
+    # JSON is still accepted so tasks queued before a deploy can be consumed
+    task_serializer="msgpack",
+    accept_content=["msgpack", "json"],
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
     task_time_limit=300,  # 5 minutes max per task
+    worker_concurrency=settings.celery_concurrency,
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    # Shrink task and result payloads on the broker
+    task_compression="gzip",
+    result_compression="gzip",
+    # No event monitoring or remote control traffic on the broker
+    worker_send_task_events=False,
+    worker_enable_remote_control=False,
+    broker_transport_options={"visibility_timeout": 3600},
 )
@@ -18,6 +18,10 @@ class Settings(BaseSettings):
     # App Password (fallback)
     gmail_app_password: str = ""
     
+    # Gmail push notifications (Pub/Sub topic and shared token in the push URL)
+    gmail_pubsub_topic: str = ""
+    gmail_push_token: str = ""
+    
     # Twilio
     twilio_account_sid: str
     twilio_auth_token: str
@@ -32,10 +36,16 @@ class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379/0"
     
+    # Celery worker processes; also sizes each process's Redis connection pool
+    celery_concurrency: int = 2
+    
     # FastAPI
     fastapi_host: str = "0.0.0.0"
     fastapi_port: int = 8000
     public_webhook_url: str
+    # API worker processes. Each keeps its own caches, activity queue and Airtable flusher,
+    # and every worker needs the same ENCRYPTION_KEY, so more than one requires it to be set
+    web_concurrency: int = 1
     
     # Calendly
     calendly_link: str
@@ -43,6 +53,9 @@ class Settings(BaseSettings):
     # Polling
     polling_interval_seconds: int = 30
     
+    # Dashboard metrics cache
+    stats_cache_seconds: int = 60
+    
     # Environment
     environment: str = "production"
     
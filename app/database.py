@@ -1,18 +1,45 @@
 """Database configuration and models for user/credential management"""
-from sqlalchemy import create_engine, Column, String, DateTime, Boolean, Text
+from sqlalchemy import create_engine, event, inspect, text, Column, String, DateTime, Boolean, Text, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import orjson
 import os
 
 # Use SQLite for simplicity (can switch to PostgreSQL for production)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./agent_data.db")
 
+if "sqlite" in DATABASE_URL:
+    engine_options = {"connect_args": {"check_same_thread": False}}
+else:
+    # Keep warm connections instead of reconnecting under request bursts
+    engine_options = {
+        "pool_size": 20,
+        "max_overflow": 40,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    query_cache_size=1200,  # Room for every hot statement's compiled SQL
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads,
+    **engine_options
 )
 
+if "sqlite" in DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so commits don't fsync the whole journal and readers don't block writers"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -45,6 +72,10 @@ class AgentCredentials(Base):
     updated_by = Column(String, nullable=True)
 
 
+# One value per service/key pair; also the conflict target for credential upserts
+Index("uq_svc_key", AgentCredentials.service_name, AgentCredentials.credential_key, unique=True)
+
+
 class AgentActivity(Base):
     """Activity log for agent operations"""
     __tablename__ = "agent_activity"
@@ -58,6 +89,12 @@ class AgentActivity(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 
+# Stats/report queries filter on activity type within a time window
+Index("ix_activity_type_ts", AgentActivity.activity_type, AgentActivity.timestamp.desc())
+# Activity log is listed newest first
+Index("ix_activity_timestamp", AgentActivity.timestamp.desc())
+
+
 class TestEmail(Base):
     """Test email submissions"""
     __tablename__ = "test_emails"
@@ -65,7 +102,7 @@ class TestEmail(Base):
     id = Column(String, primary_key=True, index=True)
     submitted_by = Column(String, nullable=False)
     email_content = Column(Text, nullable=False)
-    parsed_data = Column(Text, nullable=True)
+    parsed_data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
     processing_status = Column(String, default="pending")
     call_sid = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -74,6 +111,32 @@ class TestEmail(Base):
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    
+    # Older databases may hold several rows per service/key; keep the newest so uq_svc_key can be built
+    existing_indexes = {index["name"] for index in inspect(engine).get_indexes(AgentCredentials.__tablename__)}
+    if "uq_svc_key" not in existing_indexes:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                DELETE FROM agent_credentials WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (
+                            PARTITION BY service_name, credential_key
+                            ORDER BY updated_at DESC, created_at DESC
+                        ) AS row_num
+                        FROM agent_credentials
+                    ) ranked
+                    WHERE row_num > 1
+                )
+            """))
+    
+    # Partial index from an earlier release that no query used; it only slowed inserts
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_activity_qualified"))
+    
+    # create_all skips tables that already exist, so add any new indexes explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 def get_db():
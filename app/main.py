@@ -1,34 +1,66 @@
 """FastAPI application for Twilio webhooks"""
 from fastapi import FastAPI, Form, Request, Response
-from fastapi.responses import PlainTextResponse, HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional, Tuple
 from loguru import logger
+import asyncio
+import base64
+import hmac
+import orjson
 import sys
 import os
 
 from app.config import get_settings
-from app.services import twiml_generator, redis_client
-from app.tasks import finalize_lead_record
+from app.services import twiml_generator, async_redis_client, call_data_loader, activity_queue, airtable_service
+from app.tasks import finalize_lead_record, sync_gmail_history
 from app.database import init_db
 from app.api import admin, cmo_agent
-from app.auth import create_user, UserCreate, authenticate_user, create_access_token, Token
-from app.database import get_db
+from app.auth import create_user, UserCreate, authenticate_user, create_access_token, get_password_hash, Token
+from app.database import get_db, User
 from fastapi import Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-# Configure logging
+settings = get_settings()
+
+# Configure logging; file writes happen on a background thread so handlers never block on disk
 logger.remove()
 logger.add(sys.stderr, level="INFO")
-logger.add("logs/app.log", rotation="500 MB", level="DEBUG")
+logger.add(
+    "logs/app.log",
+    rotation="500 MB",
+    level="DEBUG" if settings.environment == "development" else "INFO",
+    enqueue=True
+)
+
+
+class TwiMLResponse(Response):
+    """TwiML document returned to Twilio voice webhooks"""
+    media_type = "text/xml"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background workers"""
+    await activity_queue.start()
+    airtable_flusher = asyncio.create_task(airtable_service.run_flusher())
+    yield
+    # Unflushed Airtable records stay queued in Redis for the next start
+    airtable_flusher.cancel()
+    await activity_queue.stop()
+    await async_redis_client.close()
 
-settings = get_settings()
 
 app = FastAPI(
     title="Mesh Cowork Lead Agent",
     description="Automated lead qualification system with CMO integration",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS for frontend
@@ -40,9 +72,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize database
-init_db()
-
 # Include API routers
 app.include_router(admin.router)
 app.include_router(cmo_agent.router)
@@ -52,12 +81,33 @@ if os.path.exists("frontend"):
     app.mount("/static", StaticFiles(directory="frontend"), name="static")
 
 
+# Frontend entry page as (mtime, contents), re-read only when the file changes
+INDEX_HTML_PATH = "frontend/index.html"
+_index_html_cache: Optional[Tuple[int, bytes]] = None
+
+
+def _index_html() -> Optional[bytes]:
+    """Get the frontend entry page, or None if there is no frontend"""
+    global _index_html_cache
+    
+    try:
+        mtime = os.stat(INDEX_HTML_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    
+    if _index_html_cache is None or _index_html_cache[0] != mtime:
+        with open(INDEX_HTML_PATH, "rb") as f:
+            _index_html_cache = (mtime, f.read())
+    
+    return _index_html_cache[1]
+
+
 @app.get("/")
 async def root():
     """Serve frontend or API info"""
-    if os.path.exists("frontend/index.html"):
-        with open("frontend/index.html") as f:
-            return HTMLResponse(content=f.read())
+    index_html = _index_html()
+    if index_html is not None:
+        return HTMLResponse(content=index_html)
     return {
         "status": "healthy",
         "service": "Mesh Cowork Lead Agent",
@@ -80,17 +130,24 @@ async def login(username: str = Form(...), password: str = Form(...), db: Sessio
     return Token(access_token=access_token, token_type="bearer")
 
 
+# Set once the first user exists so later attempts skip the users table
+_registration_closed = False
+
+
 @app.post("/api/auth/register")
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register new user (first user only, or admin-created)"""
-    # Check if any users exist
-    from app.database import User
-    user_count = db.query(User).count()
+    global _registration_closed
+    
+    # Check if any users exist; once one does, registration stays closed
+    if not _registration_closed:
+        _registration_closed = db.execute(select(User.id).limit(1)).first() is not None
     
-    if user_count > 0:
+    if _registration_closed:
         raise HTTPException(status_code=403, detail="Registration disabled. Contact admin.")
     
     user = create_user(db, user_data)
+    _registration_closed = True
     
     return {"message": "User created successfully", "username": user.username}
 
@@ -103,9 +160,6 @@ async def change_password(
     db: Session = Depends(get_db)
 ):
     """Change user password"""
-    from app.database import User
-    from app.auth import verify_password, get_password_hash
-    
     # Authenticate with current password
     user = authenticate_user(db, username, current_password)
     if not user:
@@ -127,16 +181,41 @@ async def change_password(
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
-    redis_healthy = redis_client.health_check()
+    redis_healthy = await async_redis_client.cached_health_check()
     
     return {
         "status": "healthy" if redis_healthy else "degraded",
         "redis": "connected" if redis_healthy else "disconnected",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow()
     }
 
 
-@app.post("/webhooks/twilio/call-start", response_class=PlainTextResponse)
+@app.post("/webhooks/gmail", status_code=204)
+async def gmail_push(request: Request, token: str = ""):
+    """
+    Gmail watch notification pushed by Cloud Pub/Sub
+    Queues a sync of the new history so leads arrive without waiting for a poll
+    """
+    if not settings.gmail_push_token or not hmac.compare_digest(token, settings.gmail_push_token):
+        raise HTTPException(status_code=403, detail="Invalid push token")
+    
+    envelope = await request.json()
+    
+    try:
+        notification = orjson.loads(base64.b64decode(envelope["message"]["data"]))
+        history_id = str(notification["historyId"])
+    except (KeyError, TypeError, ValueError) as e:
+        # Acknowledge anyway so Pub/Sub doesn't redeliver a message we can't use
+        logger.warning(f"Ignoring malformed Gmail push notification: {e}")
+        return Response(status_code=204)
+    
+    logger.info(f"Gmail push received: history {history_id}")
+    sync_gmail_history.delay(history_id)
+    
+    return Response(status_code=204)
+
+
+@app.post("/webhooks/twilio/call-start", response_class=TwiMLResponse)
 async def call_start(request: Request):
     """
     Initial webhook when call is answered
@@ -149,7 +228,7 @@ async def call_start(request: Request):
         logger.info(f"Call answered: {call_sid}")
         
         # Get lead data from Redis
-        call_data = redis_client.get_call_data(call_sid)
+        call_data = await call_data_loader.load(call_sid)
         
         if not call_data:
             logger.error(f"No call data found for {call_sid}")
@@ -165,7 +244,7 @@ async def call_start(request: Request):
         return twiml_generator.error()
 
 
-@app.post("/webhooks/twilio/question/{question_id}", response_class=PlainTextResponse)
+@app.post("/webhooks/twilio/question/{question_id}", response_class=TwiMLResponse)
 async def ask_question(
     question_id: str,
     CallSid: str = Form(None),
@@ -184,7 +263,7 @@ async def ask_question(
         return twiml_generator.error()
 
 
-@app.post("/webhooks/twilio/answer/{question_id}", response_class=PlainTextResponse)
+@app.post("/webhooks/twilio/answer/{question_id}", response_class=TwiMLResponse)
 async def process_answer(
     question_id: str,
     CallSid: str = Form(...),
@@ -204,7 +283,7 @@ async def process_answer(
             
             # Store answer in Redis
             if SpeechResult:
-                redis_client.update_call_answer(CallSid, question_id, SpeechResult)
+                await async_redis_client.update_call_answer(CallSid, question_id, SpeechResult)
         
         # Move to next question
         return twiml_generator.next_question(question_id)
@@ -224,20 +303,22 @@ async def call_status(
     Receive call status updates from Twilio
     Finalize lead record when call completes
     """
+    # Only a completed call needs work; Twilio also reports initiated, ringing and answered
+    if CallStatus != "completed":
+        logger.debug(f"Call status update: {CallSid} - {CallStatus}")
+        return {"status": "ignored"}
+    
     try:
         logger.info(f"Call status update: {CallSid} - {CallStatus}")
         
-        # If call completed, finalize the lead record
-        if CallStatus == "completed":
-            call_duration = int(CallDuration) if CallDuration else 0
-            
-            # Trigger async task to finalize record
-            finalize_lead_record.delay(CallSid, CallStatus, call_duration)
-            
-            # Update SMS sent timestamp
-            call_data = redis_client.get_call_data(CallSid)
-            if call_data:
-                redis_client.update_call_answer(CallSid, "sms_sent_at", datetime.utcnow().isoformat())
+        # Finalize the lead record
+        call_duration = int(CallDuration) if CallDuration else 0
+        
+        # Trigger async task to finalize record
+        finalize_lead_record.delay(CallSid, CallStatus, call_duration)
+        
+        # Update SMS sent timestamp
+        await async_redis_client.set_call_field(CallSid, "sms_sent_at", datetime.utcnow().isoformat())
         
         return {"status": "received"}
     
@@ -258,9 +339,27 @@ async def sms_status(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(
-        "app.main:app",
-        host=settings.fastapi_host,
-        port=settings.fastapi_port,
-        reload=True
-    )
+    # Once, before any worker starts, so workers never race on schema changes
+    init_db()
+    if settings.environment == "development":
+        uvicorn.run(
+            "app.main:app",
+            host=settings.fastapi_host,
+            port=settings.fastapi_port,
+            reload=True
+        )
+    else:
+        # Without a shared key each worker would encrypt credentials with its own random one
+        if settings.web_concurrency > 1 and not os.getenv("ENCRYPTION_KEY"):
+            raise SystemExit("ENCRYPTION_KEY must be set to run more than one worker")
+        
+        # C event loop and HTTP parser; requests are already logged via loguru
+        uvicorn.run(
+            "app.main:app",
+            host=settings.fastapi_host,
+            port=settings.fastapi_port,
+            loop="uvloop",
+            http="httptools",
+            workers=settings.web_concurrency,
+            access_log=False
+        )
@@ -1,4 +1,5 @@
 """Data models for lead processing"""
+import msgspec
 from pydantic import BaseModel, EmailStr
 from typing import Optional, Dict, Any
 from datetime import datetime
@@ -36,6 +37,19 @@ class UnbounceLead(BaseModel):
     page_url: str = "http://tour.meshcowork.com/private-offices/"
 
 
+class LeadPayload(msgspec.Struct):
+    """Lead as queued for process_lead, decoded once into attributes on the worker"""
+    fname: str
+    email: str
+    phone: str
+    email_received_at: datetime
+    what_kind_of_office_space_are_you_interested_in: str = "Other"
+    message: Optional[str] = None
+    campaignid: Optional[str] = None
+    page_name: str = "Mesh Cowork - Private Offices"
+    page_url: str = "http://tour.meshcowork.com/private-offices/"
+
+
 class CallAnswers(BaseModel):
     """Answers collected during qualification call"""
     years_in_business: Optional[str] = None
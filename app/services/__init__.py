@@ -2,7 +2,8 @@
 from app.services.gmail_service import gmail_service
 from app.services.twilio_service import twilio_service, twiml_generator
 from app.services.airtable_service import airtable_service
-from app.services.redis_client import redis_client
+from app.services.redis_client import redis_client, async_redis_client, call_data_loader
+from app.services.activity_queue import activity_queue
 
 __all__ = [
     "gmail_service",
@@ -10,4 +11,7 @@ __all__ = [
     "twiml_generator",
     "airtable_service",
     "redis_client",
+    "async_redis_client",
+    "call_data_loader",
+    "activity_queue",
 ]
@@ -0,0 +1,103 @@
+"""Batched background writer for agent activity log entries"""
+import asyncio
+import uuid
+from datetime import datetime
+from typing import List, Optional
+from loguru import logger
+
+from app.database import SessionLocal, AgentActivity
+
+# Flush when this many entries are pending or after this long, whichever comes first
+BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 0.5
+
+# Bounded so producers wait for the writer instead of growing memory without limit
+MAX_QUEUE_SIZE = 10000
+
+
+class ActivityQueue:
+    """In-memory queue of activity rows, bulk inserted by a background task"""
+    
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        # Entries taken off the queue but not yet handed to a write
+        self._collecting: List[dict] = []
+    
+    async def start(self) -> None:
+        """Start the background flush task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the flush task and write out anything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        batch, self._collecting = self._collecting, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+    
+    async def log(
+        self,
+        activity_type: str,
+        status: str,
+        lead_phone: Optional[str] = None,
+        lead_name: Optional[str] = None,
+        details: Optional[str] = None
+    ) -> None:
+        """Queue an activity entry, waiting if the queue is full"""
+        await self._queue.put({
+            "id": str(uuid.uuid4()),
+            "activity_type": activity_type,
+            "lead_phone": lead_phone,
+            "lead_name": lead_name,
+            "status": status,
+            "details": details,
+            "timestamp": datetime.utcnow(),
+        })
+    
+    async def _run(self) -> None:
+        """Collect up to BATCH_SIZE entries or wait FLUSH_INTERVAL_SECONDS, then flush"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            self._collecting.append(await self._queue.get())
+            deadline = loop.time() + FLUSH_INTERVAL_SECONDS
+            
+            while len(self._collecting) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._collecting.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            batch, self._collecting = self._collecting, []
+            await asyncio.to_thread(self._write, batch)
+    
+    @staticmethod
+    def _write(batch: List[dict]) -> None:
+        """Insert a batch of activity rows in one transaction"""
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(AgentActivity, batch)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} activity entries: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+# Singleton instance
+activity_queue = ActivityQueue()
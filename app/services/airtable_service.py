@@ -1,58 +1,191 @@
 """Airtable service for storing lead data"""
-from pyairtable import Api
-from typing import Optional, Dict, Any
+import asyncio
+from pyairtable import Api, retry_strategy
+from requests import HTTPError
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, Callable, List
 from datetime import datetime
 from loguru import logger
 from app.config import get_settings
 from app.models import LeadRecord
+from app.services.redis_client import redis_client
 
 settings = get_settings()
 
+# Airtable accepts at most 10 records per create request
+BATCH_SIZE = 10
+FLUSH_INTERVAL_SECONDS = 0.5
+
+# Keep-alive connections to api.airtable.com shared by all calls in this process
+HTTP_POOL_SIZE = 20
+# Methods retried on 429 rate limits; only status codes in pyairtable's forcelist (429) are retried
+RETRYABLE_METHODS = frozenset({"GET", "POST", "PATCH", "PUT", "DELETE"})
+
+
+def _is_permanent_failure(error: Exception) -> bool:
+    """Whether Airtable rejected the request itself (4xx other than rate limiting)"""
+    if not isinstance(error, HTTPError) or error.response is None:
+        return False
+    status = error.response.status_code
+    return 400 <= status < 500 and status != 429
+
+
+def _call_notes(lead: LeadRecord) -> str:
+    """Qualification reason, followed by the call answers if there are any"""
+    if not lead.call_answers:
+        return lead.qualification_reason or ""
+    
+    return (
+        f"{lead.qualification_reason or ''}\n\n"
+        f"Years in Business: {lead.call_answers.get('q1', 'Not answered')}\n"
+        f"Team Size: {lead.call_answers.get('q2', 'Not answered')}\n"
+        f"Has Clients: {lead.call_answers.get('q3', 'Not answered')}\n"
+        f"Budget: {lead.call_answers.get('q4', 'Not answered')}\n"
+        f"Space Type: {lead.call_answers.get('q5', 'Not answered')}"
+    )
+
+
+# Airtable field (exact name in the base) -> how to get its value from a lead
+FIELD_MAP: Dict[str, Callable[[LeadRecord], Any]] = {
+    "Contact Name": lambda lead: lead.name,
+    "Email": lambda lead: lead.email,
+    "Phone": lambda lead: lead.phone,
+    "Call Status": lambda lead: lead.qualification_status.value,
+    "Call Notes": _call_notes,
+    "Segment": lambda lead: lead.page_name,
+}
+
 
 class AirtableService:
     """Airtable client for lead storage"""
     
     def __init__(self):
         self.api = Api(settings.airtable_api_key)
+        # Larger keep-alive pool so concurrent callers reuse TLS connections. A 429 means
+        # Airtable didn't act on the request, so it is retried with backoff for any method,
+        # POST creates included, as are failed connects; read errors are not (read=0), since
+        # a create may already have landed and resending it would duplicate the records
+        self.api.session.mount("https://", HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=retry_strategy(
+                total=3,
+                backoff_factor=0.2,
+                allowed_methods=RETRYABLE_METHODS,
+                read=0
+            )
+        ))
         self.table = self.api.table(
             settings.airtable_base_id,
             settings.airtable_table_name
         )
     
-    def create_lead_record(self, lead: LeadRecord) -> Optional[str]:
-        """Create a new lead record in Airtable"""
+    def _build_record_data(self, lead: LeadRecord) -> Dict[str, Any]:
+        """Build Airtable fields for a lead"""
+        return {field: value(lead) for field, value in FIELD_MAP.items()}
+    
+    def create_lead_record(self, lead: LeadRecord) -> bool:
+        """
+        Queue a new lead record for a batched Airtable create
+        
+        Falls back to a direct create if the queue is unavailable.
+        
+        Returns:
+            True if the record was queued or created
+        """
+        record_data = self._build_record_data(lead)
+        
         try:
-            # Prepare record data - matching exact Airtable field names
-            record_data = {
-                "Contact Name": lead.name,
-                "Email": lead.email,
-                "Phone": lead.phone,
-                "Call Status": lead.qualification_status.value,
-                "Call Notes": lead.qualification_reason or "",
-                "Segment": lead.page_name,
-            }
-            
-            # Add call answers if available
-            if lead.call_answers:
-                record_data["Call Notes"] = (
-                    f"{lead.qualification_reason or ''}\n\n"
-                    f"Years in Business: {lead.call_answers.get('q1', 'Not answered')}\n"
-                    f"Team Size: {lead.call_answers.get('q2', 'Not answered')}\n"
-                    f"Has Clients: {lead.call_answers.get('q3', 'Not answered')}\n"
-                    f"Budget: {lead.call_answers.get('q4', 'Not answered')}\n"
-                    f"Space Type: {lead.call_answers.get('q5', 'Not answered')}"
-                )
-            
-            # Create record
-            record = self.table.create(record_data)
+            redis_client.push_airtable_record(record_data)
+            logger.info(f"Queued Airtable record for {lead.name}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not queue Airtable record for {lead.name}, creating directly: {e}")
+            return self._create(record_data, lead.name) is not None
+    
+    def create_lead_record_now(self, lead: LeadRecord) -> Optional[str]:
+        """Create a new lead record in Airtable immediately, bypassing the queue"""
+        return self._create(self._build_record_data(lead), lead.name)
+    
+    def _create(self, record_data: Dict[str, Any], name: str) -> Optional[str]:
+        """Create a single record and return its ID"""
+        try:
+            record = self.table.create(record_data, typecast=True)
             
-            logger.info(f"Created Airtable record: {record['id']} for {lead.name}")
+            logger.info(f"Created Airtable record: {record['id']} for {name}")
             return record['id']
         
         except Exception as e:
-            logger.error(f"Failed to create Airtable record for {lead.name}: {e}")
+            logger.error(f"Failed to create Airtable record for {name}: {e}")
             return None
     
+    def flush_pending(self) -> int:
+        """
+        Create up to one batch of queued records in a single request
+        
+        Returns:
+            Number of records created
+        """
+        try:
+            records = redis_client.pop_airtable_records(BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Failed to read queued Airtable records: {e}")
+            return 0
+        
+        if not records:
+            return 0
+        
+        try:
+            created = self.table.batch_create(records, typecast=True)
+        except Exception as e:
+            if _is_permanent_failure(e):
+                # One bad record rejects the whole batch, so find it by creating them one by one
+                logger.warning(f"Airtable rejected a batch of {len(records)} records, retrying individually: {e}")
+                return self._create_individually(records)
+            
+            logger.error(f"Failed to create {len(records)} Airtable records, re-queueing: {e}")
+            self._requeue(records)
+            return 0
+        
+        logger.info(f"Created {len(created)} Airtable records")
+        return len(created)
+    
+    def _create_individually(self, records: List[Dict[str, Any]]) -> int:
+        """Create records one at a time, dead-lettering any Airtable rejects"""
+        created = 0
+        
+        for i, record_data in enumerate(records):
+            try:
+                self.table.create(record_data, typecast=True)
+                created += 1
+            except Exception as e:
+                if not _is_permanent_failure(e):
+                    logger.error(f"Failed to create Airtable record, re-queueing {len(records) - i}: {e}")
+                    self._requeue(records[i:])
+                    break
+                
+                logger.error(f"Airtable rejected record for {record_data.get('Contact Name')}, dead-lettering: {e}")
+                try:
+                    redis_client.dead_letter_airtable_record(record_data, str(e))
+                except Exception as dead_letter_error:
+                    logger.error(f"Dropped Airtable record: {dead_letter_error}")
+        
+        return created
+    
+    def _requeue(self, records: List[Dict[str, Any]]) -> None:
+        """Put records back on the queue for the next flush"""
+        try:
+            redis_client.requeue_airtable_records(records)
+        except Exception as e:
+            logger.error(f"Dropped {len(records)} Airtable records: {e}")
+    
+    async def run_flusher(self) -> None:
+        """Flush queued records until cancelled, waiting between partial batches"""
+        while True:
+            created = await asyncio.to_thread(self.flush_pending)
+            if created < BATCH_SIZE:
+                await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+    
     def update_lead_record(self, record_id: str, updates: Dict[str, Any]) -> bool:
         """Update an existing lead record"""
         try:
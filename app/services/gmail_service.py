@@ -1,19 +1,112 @@
 """Gmail service for monitoring lead notifications"""
 import imaplib
 import email
+import select
+import ssl
+import time
 from email.header import decode_header
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import re
 import base64
 from loguru import logger
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from pydantic import EmailStr, TypeAdapter
 from app.config import get_settings
 from app.models import UnbounceLead
 
 settings = get_settings()
 
+# Subject line of Unbounce lead notification emails
+UNBOUNCE_SUBJECT = "new lead has been captured"
+
+# Email is the only lead field that needs validating; the rest are plain strings
+EMAIL_ADAPTER = TypeAdapter(EmailStr)
+
+# Most message UIDs sent in a single IMAP FETCH or STORE command
+IMAP_BATCH_SIZE = 200
+
+# Message UID in a UID FETCH response line
+FETCH_UID_PATTERN = re.compile(rb"UID (\d+)")
+
+# Lead fields in the notification body, each a label line followed by its value
+LEAD_FIELD_PATTERNS = {
+    field: re.compile(pattern, re.IGNORECASE)
+    for field, pattern in {
+        "fname": r"fname\s*\n\s*(.+)",
+        "email": r"email\s*\n\s*(.+)",
+        "phone": r"phone\s*\n\s*(.+)",
+        "what_kind_of_office_space_are_you_interested_in": r"what_kind_of_office_space_are_you_interested_in\s*\n\s*(.+)",
+        "message": r"message\s*\n\s*(.+)",
+        "campaignid": r"campaignid\s*\n\s*(.+)",
+        "page_name": r"Page Name\s*\n\s*(.+)",
+        "page_url": r"URL\s*\n\s*(http.+)",
+    }.items()
+}
+
+
+def parse_lead_data(body: str) -> Optional[dict]:
+    """Parse lead data from email body"""
+    try:
+        data = {}
+        
+        # Extract fields using regex patterns
+        for field, pattern in LEAD_FIELD_PATTERNS.items():
+            match = pattern.search(body)
+            if match:
+                data[field] = match.group(1).strip()
+        
+        # Validate required fields
+        if not all(k in data for k in ["fname", "email", "phone"]):
+            logger.error("Missing required fields in email")
+            return None
+        
+        return data
+    
+    except Exception as e:
+        logger.error(f"Error parsing lead data: {e}")
+        return None
+
+
+def _decode_payload(part) -> str:
+    """Decode a message part's transfer-encoded payload as UTF-8, or "" if it can't be"""
+    try:
+        return part.get_payload(decode=True).decode()
+    except (AttributeError, UnicodeDecodeError):
+        return ""
+
+
+def _read_line(connection: imaplib.IMAP4) -> bytes:
+    """Read one server line, raising instead of returning b"" once the server has hung up"""
+    line = connection.readline()
+    if not line:
+        raise imaplib.IMAP4.abort("server closed the connection")
+    return line
+
+
+def _has_data(connection: imaplib.IMAP4_SSL) -> bool:
+    """
+    Whether reading a server line won't block (data or EOF), including data imaplib
+    has already buffered from the socket where select() can't see it
+    """
+    sock = connection.sock
+    if sock.pending():
+        return True
+    
+    timeout = sock.gettimeout()
+    sock.settimeout(0)
+    try:
+        # Returns buffered bytes, or does one non-blocking socket read if there are none;
+        # an empty result means the server hung up, which the next read reports
+        connection.file.peek(1)
+        return True
+    except ssl.SSLWantReadError:
+        return False
+    finally:
+        sock.settimeout(timeout)
+
 
 class GmailService:
     """Gmail IMAP service for reading Unbounce notifications"""
@@ -23,6 +116,8 @@ class GmailService:
         self.email_address = settings.gmail_address
         self.connection: Optional[imaplib.IMAP4_SSL] = None
         self.credentials: Optional[Credentials] = None
+        # Gmail REST API client for push notifications, built on first use
+        self._api = None
         
         # Determine auth method
         self.use_oauth = bool(settings.gmail_access_token and settings.gmail_refresh_token)
@@ -100,8 +195,13 @@ class GmailService:
             except:
                 pass
     
-    def get_unread_unbounce_emails(self) -> List[tuple]:
-        """Get unread emails from Unbounce"""
+    def get_unread_unbounce_emails(self) -> List[bytes]:
+        """
+        Get unread emails from Unbounce
+        
+        Returns:
+            Message UIDs, which unlike sequence numbers don't shift as mail arrives or is deleted
+        """
         if not self.connection:
             self.connect()
         
@@ -110,9 +210,9 @@ class GmailService:
             self.connection.select("INBOX")
             
             # Search for unread emails from Unbounce
-            status, messages = self.connection.search(
-                None, 
-                '(UNSEEN SUBJECT "new lead has been captured")'
+            status, messages = self.connection.uid(
+                "SEARCH",
+                f'(UNSEEN SUBJECT "{UNBOUNCE_SUBJECT}")'
             )
             
             if status != "OK":
@@ -128,19 +228,27 @@ class GmailService:
             logger.error(f"Error fetching emails: {e}")
             return []
     
-    def parse_unbounce_email(self, email_id: bytes) -> Optional[UnbounceLead]:
-        """Parse Unbounce lead notification email"""
+    def parse_raw_email(
+        self,
+        raw_email: bytes,
+        email_id,
+        subject_filter: Optional[str] = None
+    ) -> Optional[UnbounceLead]:
+        """
+        Parse Unbounce lead notification from raw RFC 822 bytes
+        
+        Args:
+            raw_email: Full message as fetched from IMAP or the Gmail API
+            email_id: Message identifier, used in log messages
+            subject_filter: If set, skip messages whose subject doesn't contain it
+        """
         try:
-            # Fetch email
-            status, msg_data = self.connection.fetch(email_id, "(RFC822)")
+            email_message = email.message_from_bytes(raw_email)
             
-            if status != "OK":
+            if subject_filter and subject_filter.lower() not in (email_message.get("Subject") or "").lower():
+                logger.debug(f"Skipping non-lead email: {email_id}")
                 return None
             
-            # Parse email
-            email_body = msg_data[0][1]
-            email_message = email.message_from_bytes(email_body)
-            
             # Get email received time
             date_str = email_message.get("Date")
             email_received_at = email.utils.parsedate_to_datetime(date_str)
@@ -153,16 +261,16 @@ class GmailService:
                 return None
             
             # Parse lead data from body
-            lead_data = self._parse_lead_data(body)
+            lead_data = parse_lead_data(body)
             
             if not lead_data:
                 logger.warning(f"Could not parse lead data from email: {email_id}")
                 return None
             
-            # Create lead object
-            lead = UnbounceLead(
+            # Create lead object, validating the email once here instead of the whole model
+            lead = UnbounceLead.model_construct(
                 fname=lead_data.get("fname", ""),
-                email=lead_data.get("email", ""),
+                email=EMAIL_ADAPTER.validate_python(lead_data.get("email", "")),
                 phone=lead_data.get("phone", ""),
                 what_kind_of_office_space_are_you_interested_in=lead_data.get(
                     "what_kind_of_office_space_are_you_interested_in", "Other"
@@ -181,66 +289,178 @@ class GmailService:
             logger.error(f"Error parsing email {email_id}: {e}")
             return None
     
-    def mark_as_read(self, email_id: bytes) -> None:
-        """Mark email as read"""
-        try:
-            self.connection.store(email_id, "+FLAGS", "\\Seen")
-        except Exception as e:
-            logger.error(f"Error marking email as read: {e}")
-    
-    def _get_email_body(self, email_message) -> str:
-        """Extract email body text"""
-        body = ""
-        
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                content_type = part.get_content_type()
-                if content_type == "text/plain":
-                    try:
-                        body = part.get_payload(decode=True).decode()
-                        break
-                    except:
-                        pass
-        else:
+    def fetch_raw_emails(self, email_ids: List[bytes]) -> Dict[bytes, bytes]:
+        """
+        Fetch full messages with one IMAP UID FETCH per IMAP_BATCH_SIZE UIDs
+        
+        Returns:
+            Raw RFC 822 bytes keyed by email UID
+        """
+        raw_emails = {}
+        
+        for i in range(0, len(email_ids), IMAP_BATCH_SIZE):
+            batch = email_ids[i:i + IMAP_BATCH_SIZE]
             try:
-                body = email_message.get_payload(decode=True).decode()
-            except:
-                pass
+                status, msg_data = self.connection.uid("FETCH", b",".join(batch), "(RFC822)")
+                
+                if status != "OK":
+                    logger.error(f"Failed to fetch {len(batch)} emails: {status}")
+                    continue
+                
+                # Message parts are (b"<seq> (UID <uid> RFC822 {size}", raw) tuples, each followed
+                # by a closing line, which is where UID ends up if the server sends it last
+                raw = None
+                for part in msg_data:
+                    if isinstance(part, tuple):
+                        match = FETCH_UID_PATTERN.search(part[0])
+                        if match:
+                            raw_emails[match.group(1)] = part[1]
+                        else:
+                            raw = part[1]
+                    elif raw is not None:
+                        match = FETCH_UID_PATTERN.search(part)
+                        if match:
+                            raw_emails[match.group(1)] = raw
+                        raw = None
+            
+            except Exception as e:
+                logger.error(f"Error fetching {len(batch)} emails: {e}")
         
-        return body
+        return raw_emails
     
-    def _parse_lead_data(self, body: str) -> Optional[dict]:
-        """Parse lead data from email body"""
+    def mark_as_read(self, email_ids: List[bytes]) -> None:
+        """Mark emails as read with one IMAP UID STORE per IMAP_BATCH_SIZE UIDs"""
+        for i in range(0, len(email_ids), IMAP_BATCH_SIZE):
+            batch = email_ids[i:i + IMAP_BATCH_SIZE]
+            try:
+                self.connection.uid("STORE", b",".join(batch), "+FLAGS", "(\\Seen)")
+            except Exception as e:
+                logger.error(f"Error marking {len(batch)} emails as read: {e}")
+    
+    def wait_for_new_mail(self, timeout: float) -> bool:
+        """
+        Block until the server reports new mail in the selected mailbox, using IMAP IDLE
+        
+        Falls back to sleeping for the timeout if IDLE isn't available.
+        
+        Returns:
+            True if new mail arrived, False if the timeout passed first
+        """
+        connection = self.connection
+        if not connection or "IDLE" not in connection.capabilities:
+            time.sleep(timeout)
+            return False
+        
         try:
-            data = {}
-            
-            # Extract fields using regex patterns
-            patterns = {
-                "fname": r"fname\s*\n\s*(.+)",
-                "email": r"email\s*\n\s*(.+)",
-                "phone": r"phone\s*\n\s*(.+)",
-                "what_kind_of_office_space_are_you_interested_in": r"what_kind_of_office_space_are_you_interested_in\s*\n\s*(.+)",
-                "message": r"message\s*\n\s*(.+)",
-                "campaignid": r"campaignid\s*\n\s*(.+)",
-                "page_name": r"Page Name\s*\n\s*(.+)",
-                "page_url": r"URL\s*\n\s*(http.+)",
-            }
-            
-            for field, pattern in patterns.items():
-                match = re.search(pattern, body, re.IGNORECASE)
-                if match:
-                    data[field] = match.group(1).strip()
-            
-            # Validate required fields
-            if not all(k in data for k in ["fname", "email", "phone"]):
-                logger.error("Missing required fields in email")
-                return None
+            tag = connection._new_tag()
+            connection.send(tag + b" IDLE\r\n")
+            if not _read_line(connection).startswith(b"+"):
+                raise imaplib.IMAP4.abort("IDLE rejected")
+            
+            new_mail = False
+            deadline = time.monotonic() + timeout
+            try:
+                while not new_mail:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # Wait on the socket itself; a timeout on imaplib's file would break it
+                    if not _has_data(connection):
+                        select.select([connection.sock], [], [], remaining)
+                        continue
+                    new_mail = _read_line(connection).rstrip().endswith(b"EXISTS")
+            finally:
+                connection.send(b"DONE\r\n")
+                # Skip any other untagged updates up to IDLE's completion
+                while not _read_line(connection).startswith(tag):
+                    pass
             
-            return data
+            return new_mail
         
+        except (imaplib.IMAP4.error, OSError) as e:
+            logger.warning(f"IMAP IDLE failed, reconnecting on next poll: {e}")
+            self.disconnect()
+            self.connection = None
+            return False
+    
+    def _get_api(self):
+        """Get the Gmail REST API client, reusing its connection across calls"""
+        if self._api is None:
+            self._api = build("gmail", "v1", credentials=self.credentials, cache_discovery=False)
+        return self._api
+    
+    def watch_inbox(self, topic_name: str) -> dict:
+        """
+        Ask Gmail to publish inbox changes to a Pub/Sub topic
+        
+        The watch expires after 7 days and must be renewed.
+        
+        Returns:
+            Watch response with historyId and expiration
+        """
+        return self._get_api().users().watch(
+            userId="me",
+            body={"topicName": topic_name, "labelIds": ["INBOX"]}
+        ).execute()
+    
+    def list_new_message_ids(self, start_history_id: str) -> Tuple[List[str], str]:
+        """
+        List messages added to the inbox since a history ID
+        
+        Returns:
+            (message IDs, latest history ID to resume from)
+        """
+        history = self._get_api().users().history()
+        request = history.list(
+            userId="me",
+            startHistoryId=start_history_id,
+            historyTypes=["messageAdded"],
+            labelId="INBOX"
+        )
+        
+        message_ids = []
+        latest_history_id = start_history_id
+        while request is not None:
+            response = request.execute()
+            latest_history_id = response.get("historyId", latest_history_id)
+            for record in response.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message_ids.append(added["message"]["id"])
+            request = history.list_next(request, response)
+        
+        return message_ids, latest_history_id
+    
+    def fetch_raw_message(self, message_id: str) -> bytes:
+        """Fetch a full message as raw RFC 822 bytes via the Gmail API"""
+        message = self._get_api().users().messages().get(
+            userId="me",
+            id=message_id,
+            format="raw"
+        ).execute()
+        return base64.urlsafe_b64decode(message["raw"])
+    
+    def mark_messages_read(self, message_ids: List[str]) -> None:
+        """Mark messages as read via the Gmail API in one request"""
+        try:
+            self._get_api().users().messages().batchModify(
+                userId="me",
+                body={"ids": message_ids, "removeLabelIds": ["UNREAD"]}
+            ).execute()
         except Exception as e:
-            logger.error(f"Error parsing lead data: {e}")
-            return None
+            logger.error(f"Error marking {len(message_ids)} emails as read: {e}")
+    
+    def _get_email_body(self, email_message) -> str:
+        """Extract email body text"""
+        if not email_message.is_multipart():
+            return _decode_payload(email_message)
+        
+        # Walk lazily and stop at the first text/plain part that decodes
+        bodies = (
+            _decode_payload(part)
+            for part in email_message.walk()
+            if part.get_content_type() == "text/plain"
+        )
+        return next((body for body in bodies if body), "")
 
 
 # Singleton instance
@@ -1,61 +1,270 @@
 """Redis client for caching and state management"""
 import redis
-from typing import Optional
+import redis.asyncio
+import asyncio
+import hashlib
+import msgpack
+import orjson
+import re
+import time
+from typing import Dict, List, Optional, Set
 from datetime import datetime, timedelta
 from app.config import get_settings
 from loguru import logger
 
 settings = get_settings()
 
+# Connections shared by all FastAPI request handlers
+ASYNC_MAX_CONNECTIONS = 50
+
+# Sync connections per process; callers wait up to POOL_TIMEOUT_SECONDS for a free one
+SYNC_MAX_CONNECTIONS = settings.celery_concurrency * 2
+POOL_TIMEOUT_SECONDS = 2
+HEALTH_CHECK_INTERVAL_SECONDS = 30
+
+# Concurrent call data reads within this window share one pipelined round-trip
+LOADER_WINDOW_SECONDS = 0.005
+LOADER_MAX_BATCH = 100
+
+# How long a health probe result is reused before pinging Redis again
+HEALTH_CACHE_SECONDS = 2
+
+# Call data is split in two, both kept for the life of the call: lead:{sid} holds the lead
+# details as one msgpack-packed dict, written once; ans:{sid} is a hash of fields set during the call
+CALL_DATA_TTL = timedelta(hours=24)
+# Call data is kept this long after finalizing, for status webhooks that arrive after the call ends
+FINALIZED_CALL_DATA_TTL = timedelta(hours=1)
+
+# Lua function returning a call's data as {format, ...}: {'split', lead, fields} for the
+# current layout, or the whole legacy call_data:{sid} key written by an earlier release,
+# as {'hash', fields} or {'blob', packed}, which is still read until its 24h TTL runs out
+READ_CALL_LUA = """
+local function read_call()
+    local lead = redis.call('GET', KEYS[1])
+    if lead then
+        return {'split', lead, redis.call('HGETALL', KEYS[2])}
+    end
+    local kind = redis.call('TYPE', KEYS[3])['ok']
+    if kind == 'hash' then
+        return {'hash', redis.call('HGETALL', KEYS[3])}
+    elseif kind == 'string' then
+        return {'blob', redis.call('GET', KEYS[3])}
+    end
+    return false
+end
+"""
+
+# Read a call's data in one round-trip
+GET_CALL_LUA = READ_CALL_LUA + """
+return read_call()
+"""
+
+# Read a call's data and cut its TTL to ARGV[1] seconds, atomically in one round-trip
+FINALIZE_CALL_LUA = READ_CALL_LUA + """
+local data = read_call()
+if data then
+    for _, key in ipairs(KEYS) do
+        redis.call('EXPIRE', key, ARGV[1])
+    end
+end
+return data
+"""
+
+# Set field ARGV[1] to ARGV[2] on a call in one round-trip; does nothing if the
+# call data has expired, and fields expire along with the lead details
+SET_CALL_FIELD_LUA = READ_CALL_LUA + """
+local data = read_call()
+if not data then
+    return 0
+end
+if data[1] == 'split' then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    local ttl = redis.call('TTL', KEYS[1])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[2], ttl)
+    end
+elseif data[1] == 'hash' then
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+else
+    local fields = cmsgpack.unpack(data[2])
+    fields[ARGV[1]] = ARGV[2]
+    redis.call('SET', KEYS[3], cmsgpack.pack(fields), 'KEEPTTL')
+end
+return 1
+"""
+
+# Repeat submissions of the same lead within this window are dropped
+DEDUP_WINDOW = timedelta(minutes=10)
+DEDUP_HITS_KEY = "dedup_hits"
+# Stripped from phone numbers so formatting differences don't defeat dedup
+_NON_DIGIT = re.compile(r"\D")
+
+# Gmail history ID that push notifications are synced up to
+GMAIL_HISTORY_KEY = "gmail:history_id"
+
+# List of Airtable record fields waiting for a batched create
+AIRTABLE_PENDING_KEY = "airtable:pending"
+# Records Airtable rejected outright, kept for inspection and manual replay
+AIRTABLE_DEAD_LETTER_KEY = "airtable:dead_letter"
+# Any datetime field values are sent as UTC ISO 8601, which Airtable date fields accept
+AIRTABLE_JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def _call_keys(call_sid: str) -> List[str]:
+    """Keys of a call's lead details, its fields set during the call, and its legacy data"""
+    return [f"lead:{call_sid}", f"ans:{call_sid}", f"call_data:{call_sid}"]
+
+
+def _decode_fields(flat: List[bytes]) -> Dict[str, str]:
+    """Dict from a flat [field, value, ...] HGETALL reply"""
+    return {field.decode(): value.decode() for field, value in zip(flat[::2], flat[1::2])}
+
+
+def _unpack_call_result(result) -> Optional[dict]:
+    """Call data from a READ_CALL_LUA based script's reply, or None if it found no call"""
+    if not result:
+        return None
+    
+    kind = result[0]
+    if kind == b"split":
+        data = msgpack.unpackb(result[1])
+        data.update(_decode_fields(result[2]))
+        return data
+    if kind == b"hash":
+        return _decode_fields(result[1])
+    return msgpack.unpackb(result[1])
+
 
 class RedisClient:
     """Redis client wrapper"""
     
     def __init__(self):
-        self.client = redis.from_url(settings.redis_url, decode_responses=True)
+        # Bounded pool shared by every task in the process, with keepalive so
+        # idle sockets survive between bursts instead of being re-dialed.
+        # Replies stay bytes: call data is packed binary, and the rest is parsed
+        # from bytes directly, so decoding every reply would be wasted work
+        self.pool = redis.BlockingConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=SYNC_MAX_CONNECTIONS,
+            timeout=POOL_TIMEOUT_SECONDS,
+            socket_keepalive=True,
+            health_check_interval=HEALTH_CHECK_INTERVAL_SECONDS
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        # Sent by EVALSHA, falling back to EVAL the first time the server hasn't seen it
+        self._get_call = self.client.register_script(GET_CALL_LUA)
+        self._finalize_call = self.client.register_script(FINALIZE_CALL_LUA)
+        self._set_call_field = self.client.register_script(SET_CALL_FIELD_LUA)
     
-    def mark_email_processed(self, email_id: str) -> bool:
-        """Mark an email as processed to prevent duplicates"""
-        key = f"processed_email:{email_id}"
-        # Store for 7 days
-        return self.client.setex(key, timedelta(days=7), "1")
+    def claim_emails(self, email_ids: List[str], source: str) -> List[bool]:
+        """
+        Mark emails as processed to prevent duplicates, in one round-trip
+        
+        Args:
+            email_ids: Message identifiers, unique within source
+            source: "imap" for IMAP UIDs, "gmail" for Gmail API message IDs
+        
+        Returns:
+            For each email, True if this caller claimed it, False if it was already processed
+        """
+        with self.client.pipeline(transaction=False) as pipe:
+            for email_id in email_ids:
+                # Store for 7 days
+                pipe.set(f"processed_email:{source}:{email_id}", "1", nx=True, ex=timedelta(days=7))
+            return [bool(claimed) for claimed in pipe.execute()]
     
-    def is_email_processed(self, email_id: str) -> bool:
-        """Check if email has been processed"""
-        key = f"processed_email:{email_id}"
-        return self.client.exists(key) > 0
+    def release_emails(self, email_ids: List[str], source: str) -> None:
+        """Drop claims on emails that could not be processed, so a later poll retries them"""
+        self.client.delete(*(f"processed_email:{source}:{email_id}" for email_id in email_ids))
     
-    def store_lead_timestamp(self, phone: str, timestamp: datetime) -> None:
-        """Store when lead email was received"""
+    def claim_lead_submission(self, email: str, phone: str) -> bool:
+        """
+        Claim a lead submission for processing
+        
+        Returns:
+            False if the same email and phone was already claimed within DEDUP_WINDOW
+        """
+        digits = _NON_DIGIT.sub("", phone)
+        digest = hashlib.blake2b(f"{email.lower()}|{digits}".encode(), digest_size=16).hexdigest()
+        
+        if self.client.set(f"dedup:{digest}", "1", nx=True, ex=DEDUP_WINDOW):
+            return True
+        
+        self.client.incr(DEDUP_HITS_KEY)
+        return False
+    
+    def store_lead_timestamp(self, phone: str, timestamp: float) -> None:
+        """Store when lead email was received, as Unix epoch seconds"""
         key = f"lead_timestamp:{phone}"
-        self.client.setex(key, timedelta(hours=24), timestamp.isoformat())
+        self.client.setex(key, timedelta(hours=24), str(timestamp))
     
-    def get_lead_timestamp(self, phone: str) -> Optional[datetime]:
-        """Get when lead email was received"""
+    def get_lead_timestamp(self, phone: str) -> Optional[float]:
+        """Get when lead email was received, as Unix epoch seconds"""
         key = f"lead_timestamp:{phone}"
         ts = self.client.get(key)
         if ts:
-            return datetime.fromisoformat(ts)
+            return float(ts)
         return None
     
     def store_call_data(self, call_sid: str, data: dict) -> None:
-        """Store call data temporarily"""
-        key = f"call_data:{call_sid}"
-        # Store each field separately for easy access
-        for field, value in data.items():
-            self.client.hset(key, field, str(value))
-        self.client.expire(key, timedelta(hours=24))
+        """Store a call's lead details, once; later writes for the same call are ignored"""
+        self.client.set(f"lead:{call_sid}", msgpack.packb(data), nx=True, ex=CALL_DATA_TTL)
+    
+    def store_lead_and_call(self, phone: str, timestamp: float, call_sid: str, data: dict) -> None:
+        """Store the lead timestamp (epoch seconds) and call lead details in one round-trip"""
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.setex(f"lead_timestamp:{phone}", timedelta(hours=24), str(timestamp))
+            pipe.set(f"lead:{call_sid}", msgpack.packb(data), nx=True, ex=CALL_DATA_TTL)
+            pipe.execute()
     
     def get_call_data(self, call_sid: str) -> Optional[dict]:
         """Get call data"""
-        key = f"call_data:{call_sid}"
-        data = self.client.hgetall(key)
-        return data if data else None
+        return _unpack_call_result(self._get_call(keys=_call_keys(call_sid)))
     
     def update_call_answer(self, call_sid: str, question_id: str, answer: str) -> None:
         """Store answer to a specific question"""
-        key = f"call_data:{call_sid}"
-        self.client.hset(key, f"answer_{question_id}", answer)
+        self._set_call_field(keys=_call_keys(call_sid), args=[f"answer_{question_id}", answer])
+    
+    def finalize_call_data(self, call_sid: str) -> Optional[dict]:
+        """Get call data for finalizing and let it expire soon after"""
+        result = self._finalize_call(
+            keys=_call_keys(call_sid),
+            args=[int(FINALIZED_CALL_DATA_TTL.total_seconds())]
+        )
+        return _unpack_call_result(result)
+    
+    def get_gmail_history_id(self) -> Optional[str]:
+        """Get the Gmail history ID processed up to"""
+        history_id = self.client.get(GMAIL_HISTORY_KEY)
+        return history_id.decode() if history_id else None
+    
+    def set_gmail_history_id(self, history_id: str) -> None:
+        """Store the Gmail history ID processed up to"""
+        self.client.set(GMAIL_HISTORY_KEY, history_id)
+    
+    def push_airtable_record(self, fields: dict) -> None:
+        """Queue Airtable record fields for the next batched create"""
+        self.client.rpush(AIRTABLE_PENDING_KEY, orjson.dumps(fields, option=AIRTABLE_JSON_OPTIONS))
+    
+    def pop_airtable_records(self, count: int) -> List[dict]:
+        """Take up to count queued Airtable records, oldest first"""
+        payloads = self.client.lpop(AIRTABLE_PENDING_KEY, count)
+        return [orjson.loads(p) for p in payloads or []]
+    
+    def requeue_airtable_records(self, records: List[dict]) -> None:
+        """Put records from a failed batch back at the head of the queue"""
+        if records:
+            self.client.lpush(
+                AIRTABLE_PENDING_KEY,
+                *(orjson.dumps(r, option=AIRTABLE_JSON_OPTIONS) for r in reversed(records))
+            )
+    
+    def dead_letter_airtable_record(self, fields: dict, error: str) -> None:
+        """Set aside a record Airtable will never accept"""
+        self.client.rpush(AIRTABLE_DEAD_LETTER_KEY, orjson.dumps(
+            {"fields": fields, "error": error, "failed_at": datetime.utcnow()},
+            option=AIRTABLE_JSON_OPTIONS
+        ))
     
     def health_check(self) -> bool:
         """Check Redis connection"""
@@ -67,5 +276,132 @@ class RedisClient:
             return False
 
 
-# Singleton instance
+class AsyncRedisClient:
+    """Non-blocking Redis client for FastAPI request handlers"""
+    
+    def __init__(self):
+        # Replies stay bytes, like the sync client's
+        self.pool = redis.asyncio.ConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=ASYNC_MAX_CONNECTIONS
+        )
+        self.client = redis.asyncio.Redis(connection_pool=self.pool)
+        self._get_call = self.client.register_script(GET_CALL_LUA)
+        self._set_call_field = self.client.register_script(SET_CALL_FIELD_LUA)
+        self._health_ok = False
+        self._health_checked_at = float("-inf")
+    
+    async def get_call_data(self, call_sid: str) -> Optional[dict]:
+        """Get call data"""
+        return _unpack_call_result(await self._get_call(keys=_call_keys(call_sid)))
+    
+    async def queue_get_call_data(self, pipe: redis.asyncio.client.Pipeline, call_sid: str) -> None:
+        """Add a call data read to a pipeline; unpack its result with _unpack_call_result"""
+        await self._get_call(keys=_call_keys(call_sid), client=pipe)
+    
+    async def update_call_answer(self, call_sid: str, question_id: str, answer: str) -> None:
+        """Store answer to a specific question"""
+        await self.set_call_field(call_sid, f"answer_{question_id}", answer)
+    
+    async def set_call_field(self, call_sid: str, field: str, value: str) -> None:
+        """Set one field on a call's data in a single round-trip, if it hasn't expired"""
+        await self._set_call_field(keys=_call_keys(call_sid), args=[field, value])
+    
+    async def get_cached(self, key: str) -> Optional[bytes]:
+        """Get a cached payload, treating Redis errors as a cache miss"""
+        try:
+            return await self.client.get(key)
+        except Exception as e:
+            logger.warning(f"Redis cache read failed for {key}: {e}")
+            return None
+    
+    async def set_cached(self, key: str, value: str, ttl_seconds: int) -> None:
+        """Cache a payload for a short time, ignoring Redis errors"""
+        try:
+            await self.client.setex(key, ttl_seconds, value)
+        except Exception as e:
+            logger.warning(f"Redis cache write failed for {key}: {e}")
+    
+    async def health_check(self) -> bool:
+        """Check Redis connection"""
+        try:
+            await self.client.ping()
+            return True
+        except Exception as e:
+            logger.error(f"Redis health check failed: {e}")
+            return False
+    
+    async def cached_health_check(self) -> bool:
+        """Check Redis connection, reusing a recent result to avoid a PING per request"""
+        now = time.monotonic()
+        if now - self._health_checked_at >= HEALTH_CACHE_SECONDS:
+            self._health_ok = await self.health_check()
+            self._health_checked_at = now
+        return self._health_ok
+    
+    async def close(self) -> None:
+        """Close all pooled connections"""
+        await self.client.close()
+        await self.pool.disconnect()
+
+
+class CallDataLoader:
+    """Coalesces concurrent call data reads into a single Redis pipeline"""
+    
+    def __init__(self, redis_client: AsyncRedisClient):
+        self._redis = redis_client
+        # Futures waiting on each call SID in the current window
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._fetches: Set[asyncio.Task] = set()
+    
+    async def load(self, call_sid: str) -> Optional[dict]:
+        """Get call data, batched with other loads in the same window"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(call_sid, []).append(future)
+        
+        if len(self._pending) >= LOADER_MAX_BATCH:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(LOADER_WINDOW_SECONDS, self._flush)
+        
+        return await future
+    
+    def _flush(self) -> None:
+        """Send everything collected in this window as one fetch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._fetch(batch))
+            self._fetches.add(task)
+            task.add_done_callback(self._fetches.discard)
+    
+    async def _fetch(self, batch: Dict[str, List[asyncio.Future]]) -> None:
+        """Read every call SID's data in one round-trip and resolve its waiters"""
+        try:
+            async with self._redis.client.pipeline(transaction=False) as pipe:
+                for call_sid in batch:
+                    await self._redis.queue_get_call_data(pipe, call_sid)
+                results = await pipe.execute()
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        
+        for futures, result in zip(batch.values(), results):
+            data = _unpack_call_result(result)
+            for future in futures:
+                if not future.done():
+                    future.set_result(data)
+
+
+# Singleton instances
 redis_client = RedisClient()
+async_redis_client = AsyncRedisClient()
+call_data_loader = CallDataLoader(async_redis_client)
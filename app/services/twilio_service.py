@@ -1,20 +1,46 @@
 """Twilio service for voice calls and SMS"""
+import re
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
+from urllib3.util.retry import Retry
 from twilio.twiml.voice_response import VoiceResponse, Gather
-from typing import Optional
+from typing import Dict, Optional, Tuple
+from functools import lru_cache
+from xml.sax.saxutils import escape
 from loguru import logger
 from app.config import get_settings
 
 settings = get_settings()
 
+# Keep-alive connections to api.twilio.com shared by all calls in this process
+HTTP_POOL_SIZE = 32
+
+# Stripped from phone numbers before formatting
+_NON_DIGIT = re.compile(r"\D")
+
+# Question TwiML keyed by (question_id, retry_count), filled at import. Like the
+# lru_cached responses below it is built from settings read once per process, so
+# changing the voice or webhook URL takes a restart
+_TWIML_CACHE: Dict[Tuple[str, int], str] = {}
+
 
 class TwilioService:
     """Twilio client for calls and SMS"""
     
     def __init__(self):
+        http_client = TwilioHttpClient()
+        # Larger keep-alive pool so concurrent calls and SMS reuse TLS connections;
+        # urllib3 only retries a POST that never reached Twilio, so a call can't be placed twice
+        http_client.session.mount("https://", HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=Retry(total=2, backoff_factor=0.1)
+        ))
         self.client = Client(
             settings.twilio_account_sid,
-            settings.twilio_auth_token
+            settings.twilio_auth_token,
+            http_client=http_client
         )
         self.from_number = settings.twilio_phone_number
     
@@ -63,7 +89,7 @@ class TwilioService:
     def _format_phone(self, phone: str) -> str:
         """Format phone number to E.164 format"""
         # Remove all non-numeric characters
-        digits = ''.join(filter(str.isdigit, phone))
+        digits = _NON_DIGIT.sub("", phone)
         
         # Add +1 if not present (assuming US numbers)
         if not digits.startswith('1') and len(digits) == 10:
@@ -83,22 +109,51 @@ class TwiMLGenerator:
         "q5": "Do you want a private office or are you interested in coworking?"
     }
     
+    # Stands in for the lead's name in the cached greeting template
+    _NAME_PLACEHOLDER = "__LEAD_NAME__"
+    
     @staticmethod
     def greeting(lead_name: str) -> str:
         """Initial greeting TwiML"""
+        before, after = TwiMLGenerator._greeting_template()
+        return before + escape(lead_name) + after
+    
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _greeting_template() -> Tuple[str, str]:
+        """Greeting TwiML split around the lead's name, built once"""
         response = VoiceResponse()
         response.say(
-            f"Hello {lead_name}, this is Mesh Cowork calling about your inquiry. "
+            f"Hello {TwiMLGenerator._NAME_PLACEHOLDER}, this is Mesh Cowork calling about your inquiry. "
             f"I'd like to ask you a few quick questions to better understand your needs. "
             f"This will only take a minute.",
             voice=settings.twilio_voice
         )
         response.redirect(f"{settings.public_webhook_url}/webhooks/twilio/question/q1")
-        return str(response)
+        before, after = str(response).split(TwiMLGenerator._NAME_PLACEHOLDER)
+        return before, after
     
     @staticmethod
     def ask_question(question_id: str, call_sid: str = None, retry_count: int = 0) -> str:
         """Ask a qualification question with speech recognition"""
+        # The TwiML doesn't depend on the call, so every question and retry is prebuilt;
+        # anything else (unknown question, forged retry) is built per request
+        twiml = _TWIML_CACHE.get((question_id, retry_count))
+        if twiml is None:
+            twiml = TwiMLGenerator._question_twiml(question_id, retry_count)
+        return twiml
+    
+    @classmethod
+    def _build_cache(cls) -> None:
+        """Prebuild TwiML for each question, first ask and retry"""
+        _TWIML_CACHE.clear()
+        for question_id in cls.QUESTIONS:
+            for retry_count in (0, 1):
+                _TWIML_CACHE[(question_id, retry_count)] = cls._question_twiml(question_id, retry_count)
+    
+    @staticmethod
+    def _question_twiml(question_id: str, retry_count: int) -> str:
+        """Build question TwiML"""
         response = VoiceResponse()
         
         question_text = TwiMLGenerator.QUESTIONS.get(question_id)
@@ -139,6 +194,7 @@ class TwiMLGenerator:
         return str(response)
     
     @staticmethod
+    @lru_cache(maxsize=16)
     def next_question(current_question_id: str) -> str:
         """Move to next question"""
         response = VoiceResponse()
@@ -169,6 +225,7 @@ class TwiMLGenerator:
         return str(response)
     
     @staticmethod
+    @lru_cache(maxsize=1)
     def no_answer() -> str:
         """Handle no answer"""
         response = VoiceResponse()
@@ -180,6 +237,7 @@ class TwiMLGenerator:
         return str(response)
     
     @staticmethod
+    @lru_cache(maxsize=1)
     def error() -> str:
         """Handle errors"""
         response = VoiceResponse()
@@ -191,6 +249,9 @@ class TwiMLGenerator:
         return str(response)
 
 
+TwiMLGenerator._build_cache()
+
+
 # Singleton instances
 twilio_service = TwilioService()
 twiml_generator = TwiMLGenerator()
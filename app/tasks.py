@@ -1,113 +1,183 @@
 """Celery tasks for async lead processing"""
-from datetime import datetime
-from typing import Dict, Any
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Union
 from loguru import logger
+import msgspec
+import re
+import time
+from googleapiclient.errors import HttpError
 import uuid
 
 from app.celery_app import celery_app
-from app.models import LeadRecord, LeadQualification
+from app.models import LeadRecord, LeadQualification, LeadPayload
 from app.services import (
+    gmail_service,
     twilio_service,
     airtable_service,
     redis_client
 )
+from app.services.gmail_service import UNBOUNCE_SUBJECT
 from app.config import get_settings
 from app.database import SessionLocal, AgentActivity
 
 settings = get_settings()
 
+# Red flags in call answers: (question, phrases, reason), each question's phrases compiled
+# into one alternation that matches them anywhere in the lowercased answer
+RED_FLAGS = [
+    (question_id, re.compile("|".join(map(re.escape, phrases))), reason)
+    for question_id, phrases, reason in [
+        # Years in business (looking for established businesses)
+        ("q1", ["0", "zero", "new", "just started", "starting"], "Less than 1 year in business"),
+        # Number of employees (looking for teams)
+        ("q2", ["0", "zero", "none", "just me", "solo"], "Solo entrepreneur (no team)"),
+        # Has clients (looking for active businesses)
+        ("q3", ["no", "not yet", "none", "don't have"], "No current clients"),
+        # Budget (looking for realistic budget)
+        ("q4", ["don't know", "not sure", "no budget", "free"], "No clear budget"),
+    ]
+]
+
+
+def _epoch_seconds(timestamp: datetime) -> float:
+    """Unix time for a datetime, treating naive values as UTC"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def _parse_call_timestamp(value: Union[float, str, None]) -> datetime:
+    """Naive UTC datetime for epoch seconds stored with call data, or now if missing"""
+    if not value:
+        return datetime.utcnow()
+    if isinstance(value, str):
+        # Call data written by an earlier release, as a string of epoch seconds or ISO 8601
+        try:
+            value = float(value)
+        except ValueError:
+            value = _epoch_seconds(datetime.fromisoformat(value))
+    return datetime.utcfromtimestamp(value)
+
+
+def log_activity(
+    activity_type: str,
+    status: str,
+    lead_phone: Optional[str] = None,
+    lead_name: Optional[str] = None,
+    details: Optional[str] = None,
+    timestamp: Optional[datetime] = None
+) -> None:
+    """Write an activity entry, logging rather than raising on failure"""
+    db = SessionLocal()
+    try:
+        db.add(AgentActivity(
+            id=str(uuid.uuid4()),
+            activity_type=activity_type,
+            lead_name=lead_name,
+            lead_phone=lead_phone,
+            status=status,
+            details=details,
+            timestamp=timestamp or datetime.utcnow()
+        ))
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to log {activity_type} activity: {e}")
+    finally:
+        db.close()
+
 
 @celery_app.task(name="process_lead")
-def process_lead(lead_data: Dict[str, Any]) -> str:
+def process_lead(lead_data: Union[str, Dict[str, Any]]) -> str:
     """
     Process a new lead: initiate call and store in Airtable
     
     Args:
-        lead_data: Dictionary containing lead information
+        lead_data: Lead information, as a dictionary or an UnbounceLead JSON string
     
     Returns:
         Call SID or error message
     """
     try:
-        logger.info(f"Processing lead: {lead_data['fname']} - {lead_data['phone']}")
+        # Decode and type-check the payload once, then read plain attributes
+        if isinstance(lead_data, str):
+            lead = msgspec.json.decode(lead_data, type=LeadPayload)
+        else:
+            lead = msgspec.convert(lead_data, LeadPayload, strict=False)
+        
+        logger.info(f"Processing lead: {lead.fname} - {lead.phone}")
         
-        # Record call initiation time
-        call_initiated_at = datetime.utcnow()
+        # Record call initiation time; timestamps are kept as epoch seconds so
+        # they compare regardless of timezone and parse back with a float()
+        call_initiated_ts = time.time()
+        call_initiated_at = datetime.utcfromtimestamp(call_initiated_ts)
         
-        # Store timestamp in Redis for speed-to-lead calculation
-        email_received_at = datetime.fromisoformat(lead_data['email_received_at'])
-        redis_client.store_lead_timestamp(lead_data['phone'], email_received_at)
+        email_received_ts = _epoch_seconds(lead.email_received_at)
+        email_received_at = datetime.utcfromtimestamp(email_received_ts)
         
         # Calculate speed to lead
-        speed_to_lead = (call_initiated_at - email_received_at).total_seconds()
+        speed_to_lead = call_initiated_ts - email_received_ts
         
         # IMPORTANT: Store call data in Redis BEFORE initiating call
         # This prevents race condition where webhook is called before data is available
         # We'll use a temporary call_sid placeholder that will be updated after call creation
         temp_call_data = {
-            "name": lead_data['fname'],
-            "email": lead_data['email'],
-            "phone": lead_data['phone'],
-            "office_space_interest": lead_data.get('what_kind_of_office_space_are_you_interested_in', 'Other'),
-            "message": lead_data.get('message', ''),
-            "campaign_id": lead_data.get('campaignid', ''),
-            "email_received_at": email_received_at.isoformat(),
-            "call_initiated_at": call_initiated_at.isoformat(),
+            "name": lead.fname,
+            "email": lead.email,
+            "phone": lead.phone,
+            "office_space_interest": lead.what_kind_of_office_space_are_you_interested_in,
+            "message": lead.message,
+            "campaign_id": lead.campaignid,
+            "email_received_at": email_received_ts,
+            "call_initiated_at": call_initiated_ts,
             "speed_to_lead_seconds": speed_to_lead,
-            "page_name": lead_data.get('page_name', 'Mesh Cowork - Private Offices'),
-            "page_url": lead_data.get('page_url', 'http://tour.meshcowork.com/private-offices/')
+            "page_name": lead.page_name,
+            "page_url": lead.page_url
         }
         
         # Initiate Twilio call
         call_sid = twilio_service.initiate_call(
-            to_number=lead_data['phone'],
-            lead_name=lead_data['fname']
+            to_number=lead.phone,
+            lead_name=lead.fname
         )
         
         if not call_sid:
-            logger.error(f"Failed to initiate call for {lead_data['fname']}")
+            logger.error(f"Failed to initiate call for {lead.fname}")
             
             # Still create Airtable record with failure status
-            lead_record = LeadRecord(
-                name=lead_data['fname'],
-                email=lead_data['email'],
-                phone=lead_data['phone'],
-                office_space_interest=lead_data.get('what_kind_of_office_space_are_you_interested_in', 'Other'),
-                message=lead_data.get('message'),
-                campaign_id=lead_data.get('campaignid'),
+            # (fields come from an already-parsed lead, so skip re-validation)
+            lead_record = LeadRecord.model_construct(
+                name=lead.fname,
+                email=lead.email,
+                phone=lead.phone,
+                office_space_interest=lead.what_kind_of_office_space_are_you_interested_in,
+                message=lead.message,
+                campaign_id=lead.campaignid,
                 qualification_status=LeadQualification.CALL_FAILED,
                 qualification_reason="Failed to initiate call",
                 email_received_at=email_received_at,
                 call_initiated_at=call_initiated_at,
-                speed_to_lead_seconds=(call_initiated_at - email_received_at).total_seconds(),
-                page_name=lead_data.get('page_name', 'Mesh Cowork - Private Offices'),
-                page_url=lead_data.get('page_url', 'http://tour.meshcowork.com/private-offices/')
+                speed_to_lead_seconds=speed_to_lead,
+                page_name=lead.page_name,
+                page_url=lead.page_url
             )
             
+            redis_client.store_lead_timestamp(lead.phone, email_received_ts)
             airtable_service.create_lead_record(lead_record)
             return "CALL_FAILED"
         
-        # Now store call data with actual call_sid
-        redis_client.store_call_data(call_sid, temp_call_data)
+        # Now store call data with actual call_sid, along with the
+        # timestamp in Redis for speed-to-lead calculation
+        redis_client.store_lead_and_call(lead.phone, email_received_ts, call_sid, temp_call_data)
         
         # Log activity to database
-        db = SessionLocal()
-        try:
-            activity = AgentActivity(
-                id=str(uuid.uuid4()),
-                activity_type="call_made",
-                lead_name=lead_data['fname'],
-                lead_phone=lead_data['phone'],
-                status="initiated",
-                details=f"Call initiated: {call_sid}",
-                timestamp=call_initiated_at
-            )
-            db.add(activity)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Failed to log activity: {e}")
-        finally:
-            db.close()
+        log_activity(
+            "call_made",
+            "initiated",
+            lead_phone=lead.phone,
+            lead_name=lead.fname,
+            details=f"Call initiated: {call_sid}",
+            timestamp=call_initiated_at
+        )
         
         logger.info(f"Call initiated: {call_sid} | Speed to lead: {speed_to_lead:.2f}s")
         return call_sid
@@ -117,6 +187,82 @@ def process_lead(lead_data: Dict[str, Any]) -> str:
         return f"ERROR: {str(e)}"
 
 
+# Redelivered if a worker dies mid-run; that can't double-process anything, since messages
+# are claimed in Redis and the history ID only advances once they're handled. Tasks that
+# call or text a lead keep the default early ack so a crash can't repeat them.
+@celery_app.task(name="sync_gmail_history", acks_late=True, reject_on_worker_lost=True)
+def sync_gmail_history(history_id: str) -> int:
+    """
+    Queue leads from emails added since the last synced Gmail history ID
+    
+    Args:
+        history_id: History ID from a Gmail push notification
+    
+    Returns:
+        Number of leads queued
+    """
+    try:
+        start_history_id = redis_client.get_gmail_history_id()
+        
+        if not start_history_id:
+            # Nothing to diff against yet; sync from this notification onwards
+            redis_client.set_gmail_history_id(history_id)
+            return 0
+        
+        try:
+            message_ids, latest_history_id = gmail_service.list_new_message_ids(start_history_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # History ID too old; the IMAP poller picks up anything missed
+            logger.warning(f"Gmail history {start_history_id} expired, resetting to {history_id}")
+            redis_client.set_gmail_history_id(history_id)
+            return 0
+        
+        queued = 0
+        handled = []
+        # Claim every new message in one round-trip; others already handled them
+        claimed = redis_client.claim_emails(message_ids, "gmail") if message_ids else []
+        
+        for message_id, is_new in zip(message_ids, claimed):
+            if not is_new:
+                continue
+            
+            lead = gmail_service.parse_raw_email(
+                gmail_service.fetch_raw_message(message_id),
+                message_id,
+                subject_filter=UNBOUNCE_SUBJECT
+            )
+            
+            if not lead:
+                continue
+            
+            handled.append(message_id)
+            
+            # Skip repeat form submissions
+            if not redis_client.claim_lead_submission(lead.email, lead.phone):
+                logger.info(f"Duplicate submission from {lead.email}, skipping")
+                continue
+            
+            process_lead.delay(lead.model_dump_json())
+            
+            queued += 1
+            logger.info(f"Lead queued from Gmail push: {lead.fname} ({lead.phone})")
+        
+        # Mark read so the IMAP fallback poller skips them
+        if handled:
+            gmail_service.mark_messages_read(handled)
+        
+        # Advance only after processing, so a failed run is retried from the same point
+        redis_client.set_gmail_history_id(latest_history_id)
+        
+        return queued
+    
+    except Exception as e:
+        logger.error(f"Error syncing Gmail history {history_id}: {e}")
+        return 0
+
+
 @celery_app.task(name="send_followup_sms")
 def send_followup_sms(phone: str, name: str, qualified: bool = True) -> bool:
     """
@@ -147,23 +293,13 @@ def send_followup_sms(phone: str, name: str, qualified: bool = True) -> bool:
         success = twilio_service.send_sms(phone, message)
         
         # Log activity to database
-        db = SessionLocal()
-        try:
-            activity = AgentActivity(
-                id=str(uuid.uuid4()),
-                activity_type="sms_sent",
-                lead_name=name,
-                lead_phone=phone,
-                status="success" if success else "failed",
-                details=f"Follow-up SMS {'sent' if success else 'failed'}. {'A2P registration may be pending.' if not success else ''}",
-                timestamp=datetime.utcnow()
-            )
-            db.add(activity)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Failed to log SMS activity: {e}")
-        finally:
-            db.close()
+        log_activity(
+            "sms_sent",
+            "success" if success else "failed",
+            lead_phone=phone,
+            lead_name=name,
+            details=f"Follow-up SMS {'sent' if success else 'failed'}. {'A2P registration may be pending.' if not success else ''}"
+        )
         
         if success:
             logger.info(f"SMS sent to {phone}")
@@ -192,7 +328,7 @@ def finalize_lead_record(call_sid: str, call_status: str, call_duration: int = 0
     """
     try:
         # Get call data from Redis
-        call_data = redis_client.get_call_data(call_sid)
+        call_data = redis_client.finalize_call_data(call_sid)
         
         if not call_data:
             logger.error(f"No call data found for {call_sid}")
@@ -214,19 +350,11 @@ def finalize_lead_record(call_sid: str, call_status: str, call_duration: int = 0
         call_completed_at = datetime.utcnow()
         
         # Parse datetime fields safely
-        email_received_at = call_data.get("email_received_at")
-        if isinstance(email_received_at, str):
-            email_received_at = datetime.fromisoformat(email_received_at)
-        elif not isinstance(email_received_at, datetime):
-            email_received_at = datetime.utcnow()
-        
-        call_initiated_at = call_data.get("call_initiated_at")
-        if isinstance(call_initiated_at, str):
-            call_initiated_at = datetime.fromisoformat(call_initiated_at)
-        elif not isinstance(call_initiated_at, datetime):
-            call_initiated_at = datetime.utcnow()
-        
-        lead_record = LeadRecord(
+        email_received_at = _parse_call_timestamp(call_data.get("email_received_at"))
+        call_initiated_at = _parse_call_timestamp(call_data.get("call_initiated_at"))
+        
+        # Fields are converted above, so skip re-validation
+        lead_record = LeadRecord.model_construct(
             name=call_data.get("name", ""),
             email=call_data.get("email", ""),
             phone=call_data.get("phone", ""),
@@ -247,39 +375,30 @@ def finalize_lead_record(call_sid: str, call_status: str, call_duration: int = 0
             page_url=call_data.get("page_url", "http://tour.meshcowork.com/private-offices/")
         )
         
-        # Save to Airtable (but don't fail if it doesn't work)
-        record_id = airtable_service.create_lead_record(lead_record)
-        
-        if record_id:
-            logger.info(f"Lead record finalized in Airtable: {record_id}")
-        else:
-            logger.warning(f"Airtable save failed for {call_sid}, but continuing with SMS")
-        
-        # Send follow-up SMS regardless of Airtable status
+        # Send follow-up SMS first, so it never waits on Airtable (whose
+        # fallback path is a direct HTTPS create when the queue is down)
         send_followup_sms.delay(
             phone=lead_record.phone,
             name=lead_record.name,
             qualified=(qualification_status == LeadQualification.QUALIFIED)
         )
         
+        # Save to Airtable (but don't fail if it doesn't work)
+        queued = airtable_service.create_lead_record(lead_record)
+        
+        if queued:
+            logger.info(f"Lead record queued for Airtable: {call_sid}")
+        else:
+            logger.warning(f"Airtable save failed for {call_sid}, SMS already sent")
+        
         # Log lead processing completion
-        db = SessionLocal()
-        try:
-            activity = AgentActivity(
-                id=str(uuid.uuid4()),
-                activity_type="lead_processed",
-                lead_name=lead_record.name,
-                lead_phone=lead_record.phone,
-                status="qualified" if qualification_status == LeadQualification.QUALIFIED else "not_qualified",
-                details=f"Lead finalized: {qualification_reason}. Airtable: {'saved' if record_id else 'failed'}",
-                timestamp=datetime.utcnow()
-            )
-            db.add(activity)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Failed to log lead processing activity: {e}")
-        finally:
-            db.close()
+        log_activity(
+            "lead_processed",
+            "qualified" if qualification_status == LeadQualification.QUALIFIED else "not_qualified",
+            lead_phone=lead_record.phone,
+            lead_name=lead_record.name,
+            details=f"Lead finalized: {qualification_reason}. Airtable: {'queued' if queued else 'failed'}"
+        )
         
         logger.info(f"Lead processing completed for {call_sid}")
         return True
@@ -303,27 +422,11 @@ def _determine_qualification(answers: Dict[str, str], call_status: str) -> tuple
     if not any(answers.values()):
         return LeadQualification.NO_ANSWER, "No answers recorded"
     
-    reasons = []
-    
-    # Q1: Years in business (looking for established businesses)
-    years = answers.get("q1", "").lower()
-    if any(word in years for word in ["0", "zero", "new", "just started", "starting"]):
-        reasons.append("Less than 1 year in business")
-    
-    # Q2: Number of employees (looking for teams)
-    employees = answers.get("q2", "").lower()
-    if any(word in employees for word in ["0", "zero", "none", "just me", "solo"]):
-        reasons.append("Solo entrepreneur (no team)")
-    
-    # Q3: Has clients (looking for active businesses)
-    clients = answers.get("q3", "").lower()
-    if any(word in clients for word in ["no", "not yet", "none", "don't have"]):
-        reasons.append("No current clients")
-    
-    # Q4: Budget (looking for realistic budget)
-    budget = answers.get("q4", "").lower()
-    if any(word in budget for word in ["don't know", "not sure", "no budget", "free"]):
-        reasons.append("No clear budget")
+    reasons = [
+        reason
+        for question_id, pattern, reason in RED_FLAGS
+        if pattern.search(answers.get(question_id, "").lower())
+    ]
     
     # Qualification logic: Disqualify if 3+ red flags
     if len(reasons) >= 3:
@@ -8,12 +8,17 @@ from app.config import get_settings
 from app.services import gmail_service, redis_client
 from app.tasks import process_lead
 
-# Configure logging
+settings = get_settings()
+
+# Configure logging; file writes happen on a background thread so handlers never block on disk
 logger.remove()
 logger.add(sys.stderr, level="INFO")
-logger.add("logs/poller.log", rotation="500 MB", level="DEBUG")
-
-settings = get_settings()
+logger.add(
+    "logs/poller.log",
+    rotation="500 MB",
+    level="DEBUG" if settings.environment == "development" else "INFO",
+    enqueue=True
+)
 
 
 def poll_gmail():
@@ -36,36 +41,60 @@ def poll_gmail():
                 if email_ids:
                     logger.info(f"Processing {len(email_ids)} new leads")
                 
-                for email_id in email_ids:
+                # Emails to flag as read in one STORE once the batch is done
+                handled_ids = []
+                new_ids = []
+                
+                # Claim all emails in Redis at once, skipping already processed ones (prevent duplicates)
+                email_id_strs = [
+                    email_id.decode() if isinstance(email_id, bytes) else str(email_id)
+                    for email_id in email_ids
+                ]
+                claimed = redis_client.claim_emails(email_id_strs, "imap") if email_ids else []
+                
+                for email_id, email_id_str, is_new in zip(email_ids, email_id_strs, claimed):
+                    if is_new:
+                        new_ids.append(email_id)
+                    else:
+                        logger.info(f"Email {email_id_str} already processed, skipping")
+                        handled_ids.append(email_id)
+                
+                # Fetch all new emails in one round-trip
+                raw_emails = gmail_service.fetch_raw_emails(new_ids) if new_ids else {}
+                
+                # Leave emails that failed to fetch unread and unclaimed so the next poll retries them
+                unfetched = [email_id for email_id in new_ids if email_id not in raw_emails]
+                if unfetched:
+                    logger.warning(f"Failed to fetch {len(unfetched)} emails, will retry")
+                    redis_client.release_emails(
+                        [email_id.decode() if isinstance(email_id, bytes) else str(email_id) for email_id in unfetched],
+                        "imap"
+                    )
+                
+                for email_id in new_ids:
+                    raw_email = raw_emails.get(email_id)
+                    if raw_email is None:
+                        continue
+                    
                     try:
-                        # Check if already processed (prevent duplicates)
                         email_id_str = email_id.decode() if isinstance(email_id, bytes) else str(email_id)
                         
-                        if redis_client.is_email_processed(email_id_str):
-                            logger.info(f"Email {email_id_str} already processed, skipping")
-                            gmail_service.mark_as_read(email_id)
-                            continue
-                        
                         # Parse lead data
-                        lead = gmail_service.parse_unbounce_email(email_id)
+                        lead = gmail_service.parse_raw_email(raw_email, email_id_str)
+                        handled_ids.append(email_id)
                         
                         if not lead:
                             logger.warning(f"Failed to parse email {email_id_str}")
-                            gmail_service.mark_as_read(email_id)
                             continue
                         
-                        # Mark as processed in Redis
-                        redis_client.mark_email_processed(email_id_str)
-                        
-                        # Mark email as read
-                        gmail_service.mark_as_read(email_id)
-                        
-                        # Queue lead for processing (async via Celery)
-                        lead_dict = lead.model_dump()
-                        # Convert datetime to ISO string for JSON serialization
-                        lead_dict['email_received_at'] = lead.email_received_at.isoformat()
+                        # Skip repeat form submissions
+                        if not redis_client.claim_lead_submission(lead.email, lead.phone):
+                            logger.info(f"Duplicate submission from {lead.email}, skipping")
+                            continue
                         
-                        process_lead.delay(lead_dict)
+                        # Queue lead for processing (async via Celery), serialized
+                        # straight to JSON by pydantic-core with no dict in between
+                        process_lead.delay(lead.model_dump_json())
                         
                         logger.info(f"✓ Lead queued: {lead.fname} ({lead.phone})")
                     
@@ -73,8 +102,12 @@ def poll_gmail():
                         logger.error(f"Error processing email {email_id}: {e}")
                         continue
                 
-                # Sleep before next poll
-                time.sleep(settings.polling_interval_seconds)
+                # Mark emails as read
+                if handled_ids:
+                    gmail_service.mark_as_read(handled_ids)
+                
+                # Wait for Gmail to push new mail (IMAP IDLE), re-polling at least every interval
+                gmail_service.wait_for_new_mail(settings.polling_interval_seconds)
             
             except KeyboardInterrupt:
                 logger.info("Polling interrupted by user")
@@ -0,0 +1,40 @@
+"""Start or renew Gmail push notifications for new leads"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from app.config import get_settings
+from app.services import gmail_service, redis_client
+
+settings = get_settings()
+
+def watch_gmail():
+    """Point the inbox watch at the Pub/Sub topic (re-run at least weekly)"""
+    if not settings.gmail_pubsub_topic:
+        print("❌ GMAIL_PUBSUB_TOPIC is not set")
+        return False
+    
+    try:
+        response = gmail_service.watch_inbox(settings.gmail_pubsub_topic)
+        
+        # Only seed the sync point on first setup; renewals keep syncing from where they were
+        if not redis_client.get_gmail_history_id():
+            redis_client.set_gmail_history_id(str(response["historyId"]))
+        
+        expires_at = datetime.utcfromtimestamp(int(response["expiration"]) / 1000)
+        print(f"\n✅ Watching inbox via {settings.gmail_pubsub_topic}")
+        print(f"History ID: {response['historyId']}")
+        print(f"Expires: {expires_at.isoformat()} UTC")
+        
+        return True
+    
+    except Exception as e:
+        print(f"\n❌ Failed to start Gmail watch: {e}")
+        print("\nCheck that the topic exists and gmail-api-push@system.gserviceaccount.com can publish to it.")
+        return False
+
+if __name__ == "__main__":
+    watch_gmail()
@@ -11,12 +11,12 @@ until redis-cli ping > /dev/null 2>&1; do
 done
 echo "Redis is ready!"
 
-# Create admin user if it doesn't exist
+# Create tables and the admin user once, before the API workers start
 echo "Creating admin user..."
 python scripts/create_admin.py || echo "Admin user already exists or creation failed"
 
 # Start Celery worker in background
-celery -A app.celery_app worker --loglevel=info --concurrency=2 &
+celery -A app.celery_app worker --loglevel=info &
 
 # Start Gmail poller in background (if app password is configured)
 if [ -n "$GMAIL_APP_PASSWORD" ]; then
@@ -26,5 +26,14 @@ else
   echo "Gmail poller disabled - use Test Email tab in dashboard"
 fi
 
-# Start FastAPI (foreground)
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000
+# Start FastAPI (foreground) with WEB_CONCURRENCY workers, one by default; nproc reports
+# host CPUs rather than the container's quota, so the count is set explicitly
+WORKERS="${WEB_CONCURRENCY:-1}"
+if [ "$WORKERS" -gt 1 ] && [ -z "$ENCRYPTION_KEY" ]; then
+  echo "ENCRYPTION_KEY must be set to run more than one API worker" >&2
+  exit 1
+fi
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 \
+  --loop uvloop --http httptools \
+  --workers "$WORKERS" \
+  --no-access-log